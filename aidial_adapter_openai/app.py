@@ -5,7 +5,7 @@ from aidial_sdk.exceptions import InvalidRequestError
 from aidial_sdk.telemetry.init import init_telemetry
 from aidial_sdk.telemetry.types import TelemetryConfig
 from fastapi import FastAPI, Request
-from fastapi.responses import Response
+from fastapi.responses import JSONResponse, Response
 from openai import (
     APIConnectionError,
     APIError,
@@ -21,7 +21,7 @@ from aidial_adapter_openai.dalle3 import (
 from aidial_adapter_openai.databricks import (
     chat_completion as databricks_chat_completion,
 )
-from aidial_adapter_openai.dial_api.storage import create_file_storage
+from aidial_adapter_openai.dial_api.storage import DIAL_URL, create_file_storage
 from aidial_adapter_openai.env import (
     API_VERSIONS_MAPPING,
     DALLE3_AZURE_API_VERSION,
@@ -32,17 +32,25 @@ from aidial_adapter_openai.env import (
     MISTRAL_DEPLOYMENTS,
     MODEL_ALIASES,
     NON_STREAMING_DEPLOYMENTS,
+    WARMUP_CONNECTIONS,
+    WARMUP_TIMEOUT,
+    WARMUP_UPSTREAM_ENDPOINTS,
 )
 from aidial_adapter_openai.gpt import gpt_chat_completion
 from aidial_adapter_openai.gpt4_multi_modal.chat_completion import (
+    GPT4V_TOKENIZER_MODEL,
     gpt4_vision_chat_completion,
     gpt4o_chat_completion,
 )
 from aidial_adapter_openai.mistral import (
     chat_completion as mistral_chat_completion,
 )
+from aidial_adapter_openai.tokenization import tokenize, truncate_prompt
 from aidial_adapter_openai.utils.auth import get_credentials
-from aidial_adapter_openai.utils.http_client import get_http_client
+from aidial_adapter_openai.utils.circuit_breaker import (
+    call_with_circuit_breaker,
+)
+from aidial_adapter_openai.utils.http_client import close_http_clients
 from aidial_adapter_openai.utils.log_config import configure_loggers, logger
 from aidial_adapter_openai.utils.parsers import (
     completions_parser,
@@ -54,14 +62,42 @@ from aidial_adapter_openai.utils.streaming import create_server_response
 from aidial_adapter_openai.utils.tokenizer import (
     MultiModalTokenizer,
     PlainTextTokenizer,
+    get_tokenizer,
 )
+from aidial_adapter_openai.utils.warmup import warm_up_connections
+
+
+def preload_tokenizers() -> None:
+    """
+    Creating the tokenizers on startup, so that a misconfigured model
+    fails the startup rather than the first request to the deployment.
+    """
+    for deployment in filter(None, GPT4O_DEPLOYMENTS):
+        get_tokenizer(
+            MultiModalTokenizer, MODEL_ALIASES.get(deployment, deployment)
+        )
+
+    if any(GPT4_VISION_DEPLOYMENTS):
+        get_tokenizer(MultiModalTokenizer, GPT4V_TOKENIZER_MODEL)
+
+    for deployment, model in MODEL_ALIASES.items():
+        if deployment not in GPT4O_DEPLOYMENTS:
+            get_tokenizer(PlainTextTokenizer, model)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    preload_tokenizers()
+    if WARMUP_CONNECTIONS > 0:
+        await warm_up_connections(
+            upstream_endpoints=WARMUP_UPSTREAM_ENDPOINTS,
+            dial_url=DIAL_URL,
+            connections=WARMUP_CONNECTIONS,
+            timeout=WARMUP_TIMEOUT,
+        )
     yield
     logger.info("Application shutdown")
-    await get_http_client().aclose()
+    await close_http_clients()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -95,7 +131,12 @@ async def chat_completion(deployment_id: str, request: Request):
 
     return create_server_response(
         emulate_streaming,
-        await call_chat_completion(deployment_id, data, is_stream, request),
+        await call_with_circuit_breaker(
+            request.headers["X-UPSTREAM-ENDPOINT"],
+            lambda: call_chat_completion(
+                deployment_id, data, is_stream, request
+            ),
+        ),
     )
 
 
@@ -158,7 +199,7 @@ async def call_chat_completion(
 
     openai_model_name = MODEL_ALIASES.get(deployment_id, deployment_id)
     if deployment_id in GPT4O_DEPLOYMENTS:
-        tokenizer = MultiModalTokenizer(openai_model_name)
+        tokenizer = get_tokenizer(MultiModalTokenizer, openai_model_name)
         storage = create_file_storage("images", request.headers)
         return await gpt4o_chat_completion(
             data,
@@ -171,7 +212,7 @@ async def call_chat_completion(
             tokenizer,
         )
 
-    tokenizer = PlainTextTokenizer(model=openai_model_name)
+    tokenizer = get_tokenizer(PlainTextTokenizer, openai_model_name)
     return await gpt_chat_completion(
         data,
         deployment_id,
@@ -197,7 +238,26 @@ async def embedding(deployment_id: str, request: Request):
         {**creds, "api_version": api_version}
     )
 
-    return await call_with_extra_body(client.embeddings.create, data)
+    return await call_with_circuit_breaker(
+        upstream_endpoint,
+        lambda: call_with_extra_body(client.embeddings.create, data),
+    )
+
+
+@app.post("/openai/deployments/{deployment_id:path}/tokenize")
+async def tokenize_endpoint(deployment_id: str, request: Request):
+    data = await parse_body(request)
+    storage = create_file_storage("images", request.headers)
+    response = await tokenize(deployment_id, data, storage)
+    return JSONResponse(content=response.dict())
+
+
+@app.post("/openai/deployments/{deployment_id:path}/truncate_prompt")
+async def truncate_prompt_endpoint(deployment_id: str, request: Request):
+    data = await parse_body(request)
+    storage = create_file_storage("images", request.headers)
+    response = await truncate_prompt(deployment_id, data, storage)
+    return JSONResponse(content=response.dict())
 
 
 @app.exception_handler(OpenAIError)
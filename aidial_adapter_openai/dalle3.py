@@ -1,12 +1,13 @@
 from typing import Any, AsyncIterator, Optional
 
-import aiohttp
 from aidial_sdk.exceptions import HTTPException as DIALException
 from aidial_sdk.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 
 from aidial_adapter_openai.dial_api.storage import FileStorage
 from aidial_adapter_openai.utils.auth import OpenAICreds, get_auth_headers
+from aidial_adapter_openai.utils.circuit_breaker import get_retry_headers
+from aidial_adapter_openai.utils.http_client import get_aiohttp_session
 from aidial_adapter_openai.utils.streaming import build_chunk, generate_id
 
 IMG_USAGE = {
@@ -19,37 +20,44 @@ IMG_USAGE = {
 async def generate_image(
     api_url: str, creds: OpenAICreds, user_prompt: str
 ) -> JSONResponse | Any:
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            api_url,
-            json={"prompt": user_prompt, "response_format": "b64_json"},
-            headers=get_auth_headers(creds),
-        ) as response:
-            status_code = response.status
-
-            data = await response.json()
-
-            if status_code == 200:
-                return data
-
-            if "error" in data:
-                error = data["error"]
-
-                if error.get("code") in [
-                    "content_policy_violation",
-                    "contentFilter",
-                ]:
-                    error["code"] = "content_filter"
-
-                return DIALException(
-                    status_code=status_code,
-                    message=error.get("message"),
-                    type=error.get("type"),
-                    param=error.get("param"),
-                    code=error.get("code"),
-                ).to_fastapi_response()
-            else:
-                return JSONResponse(content=data, status_code=status_code)
+    async with get_aiohttp_session().post(
+        api_url,
+        json={"prompt": user_prompt, "response_format": "b64_json"},
+        headers=get_auth_headers(creds),
+    ) as response:
+        status_code = response.status
+
+        data = await response.json()
+
+        if status_code == 200:
+            return data
+
+        if "error" in data:
+            error = data["error"]
+
+            if error.get("code") in [
+                "content_policy_violation",
+                "contentFilter",
+            ]:
+                error["code"] = "content_filter"
+
+            response_with_error = DIALException(
+                status_code=status_code,
+                message=error.get("message"),
+                type=error.get("type"),
+                param=error.get("param"),
+                code=error.get("code"),
+            ).to_fastapi_response()
+            response_with_error.headers.update(
+                get_retry_headers(response.headers)
+            )
+            return response_with_error
+        else:
+            return JSONResponse(
+                content=data,
+                status_code=status_code,
+                headers=get_retry_headers(response.headers),
+            )
 
 
 def build_custom_content(base64_image: str, revised_prompt: str) -> Any:
@@ -11,6 +11,7 @@ from pydantic import BaseModel
 
 from aidial_adapter_openai.utils.auth import Auth
 from aidial_adapter_openai.utils.env import get_env, get_env_bool
+from aidial_adapter_openai.utils.http_client import get_aiohttp_session
 from aidial_adapter_openai.utils.log_config import logger as log
 
 CORE_API_VERSION = os.getenv("CORE_API_VERSION")
@@ -35,9 +36,9 @@ class FileStorage(BaseModel):
 
     bucket: Optional[Bucket] = None
 
-    async def _get_bucket(self, session: aiohttp.ClientSession) -> Bucket:
+    async def _get_bucket(self) -> Bucket:
         if self.bucket is None:
-            async with session.get(
+            async with get_aiohttp_session().get(
                 f"{self.dial_url}/v1/bucket",
                 headers=self.auth.headers,
             ) as response:
@@ -47,8 +48,8 @@ class FileStorage(BaseModel):
 
         return self.bucket
 
-    async def _get_user_bucket(self, session: aiohttp.ClientSession) -> str:
-        bucket = await self._get_bucket(session)
+    async def _get_user_bucket(self) -> str:
+        bucket = await self._get_bucket()
         appdata = bucket.get("appdata")
         if appdata is None:
             raise ValueError(
@@ -72,24 +73,23 @@ class FileStorage(BaseModel):
     async def upload(
         self, filename: str, content_type: str, content: bytes
     ) -> FileMetadata:
-        async with aiohttp.ClientSession() as session:
-            bucket = await self._get_bucket(session)
+        bucket = await self._get_bucket()
 
-            appdata = bucket["appdata"]
-            ext = mimetypes.guess_extension(content_type) or ""
-            url = f"{self.dial_url}/v1/files/{appdata}/{self.upload_dir}/{filename}{ext}"
+        appdata = bucket["appdata"]
+        ext = mimetypes.guess_extension(content_type) or ""
+        url = f"{self.dial_url}/v1/files/{appdata}/{self.upload_dir}/{filename}{ext}"
 
-            data = FileStorage._to_form_data(filename, content_type, content)
+        data = FileStorage._to_form_data(filename, content_type, content)
 
-            async with session.put(
-                url=url,
-                data=data,
-                headers=self.auth.headers,
-            ) as response:
-                response.raise_for_status()
-                meta = await response.json()
-                log.debug(f"Uploaded file: url={url}, metadata={meta}")
-                return meta
+        async with get_aiohttp_session().put(
+            url=url,
+            data=data,
+            headers=self.auth.headers,
+        ) as response:
+            response.raise_for_status()
+            meta = await response.json()
+            log.debug(f"Uploaded file: url={url}, metadata={meta}")
+            return meta
 
     async def upload_file_as_base64(
         self, data: str, content_type: str
@@ -128,8 +128,7 @@ class FileStorage(BaseModel):
         if link.startswith("public/"):
             bucket = "public"
         else:
-            async with aiohttp.ClientSession() as session:
-                bucket = await self._get_user_bucket(session)
+            bucket = await self._get_user_bucket()
 
         link = link.removeprefix(f"{bucket}/")
         decoded_link = unquote(link)
@@ -137,10 +136,9 @@ class FileStorage(BaseModel):
 
 
 async def download_file(url: str, headers: Mapping[str, str] = {}) -> bytes:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers) as response:
-            response.raise_for_status()
-            return await response.read()
+    async with get_aiohttp_session().get(url, headers=headers) as response:
+        response.raise_for_status()
+        return await response.read()
 
 
 def _compute_hash_digest(file_content: str) -> str:
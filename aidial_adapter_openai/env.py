@@ -1,6 +1,8 @@
 import json
 import os
-from typing import Dict
+from typing import Dict, Optional
+
+from pydantic import BaseModel
 
 from aidial_adapter_openai.utils.env import get_env_bool
 from aidial_adapter_openai.utils.log_config import logger
@@ -26,6 +28,21 @@ DALLE3_AZURE_API_VERSION = os.getenv("DALLE3_AZURE_API_VERSION", "2024-02-01")
 NON_STREAMING_DEPLOYMENTS = parse_deployment_list(
     os.getenv("NON_STREAMING_DEPLOYMENTS")
 )
+WARMUP_UPSTREAM_ENDPOINTS = [
+    endpoint
+    for endpoint in parse_deployment_list(
+        os.getenv("WARMUP_UPSTREAM_ENDPOINTS")
+    )
+    if endpoint
+]
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "0"))
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "10"))
+SPECULATIVE_UPSTREAM_CONNECT = get_env_bool(
+    "SPECULATIVE_UPSTREAM_CONNECT", False
+)
+ZERO_LAG_STREAMING_DEPLOYMENTS = parse_deployment_list(
+    os.getenv("ZERO_LAG_STREAMING_DEPLOYMENTS")
+)
 
 
 def get_eliminate_empty_choices() -> bool:
@@ -39,3 +56,27 @@ def get_eliminate_empty_choices() -> bool:
         return get_env_bool(old_name, False)
 
     return get_env_bool(new_name, False)
+
+
+class StreamTimeouts(BaseModel):
+    first_chunk_timeout: Optional[float] = None
+    """The maximum number of seconds to wait for the first chunk of the upstream stream"""
+
+    idle_timeout: Optional[float] = None
+    """The maximum number of seconds to wait for each following chunk"""
+
+
+STREAM_TIMEOUTS: Dict[str, StreamTimeouts] = {
+    deployment: StreamTimeouts.parse_obj(timeouts)
+    for deployment, timeouts in json.loads(
+        os.getenv("STREAM_TIMEOUTS") or "{}"
+    ).items()
+}
+
+
+def get_stream_timeouts(deployment: str) -> StreamTimeouts:
+    return (
+        STREAM_TIMEOUTS.get(deployment)
+        or STREAM_TIMEOUTS.get("*")
+        or StreamTimeouts()
+    )
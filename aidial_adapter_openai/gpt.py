@@ -1,36 +1,56 @@
+from time import monotonic
 from typing import AsyncIterator, List, Tuple, cast
 
 from aidial_sdk.exceptions import InvalidRequestError
-from openai import AsyncStream
 from openai.types.chat.chat_completion import ChatCompletion
 from openai.types.chat.chat_completion_chunk import ChatCompletionChunk
 
 from aidial_adapter_openai.utils.auth import OpenAICreds
-from aidial_adapter_openai.utils.parsers import chat_completions_parser
-from aidial_adapter_openai.utils.reflection import call_with_extra_body
+from aidial_adapter_openai.utils.hedging import (
+    hedged_stream,
+    is_hedging_enabled,
+)
+from aidial_adapter_openai.utils.parsers import (
+    AzureOpenAIEndpoint,
+    chat_completions_parser,
+)
+from aidial_adapter_openai.utils.passthrough_stream import (
+    is_passthrough_enabled,
+    passthrough_stream,
+)
+from aidial_adapter_openai.utils.reflection import (
+    call_with_extra_body,
+    with_extra_body,
+)
 from aidial_adapter_openai.utils.streaming import (
     chunk_to_dict,
     debug_print,
     generate_stream,
     map_stream,
+    wait_for_stream_start,
 )
 from aidial_adapter_openai.utils.tokenizer import PlainTextTokenizer
+from aidial_adapter_openai.utils.tokenizer_pool import run_tokenization
 from aidial_adapter_openai.utils.truncate_prompt import (
     DiscardedMessages,
     TruncatedTokens,
     truncate_prompt,
 )
+from aidial_adapter_openai.utils.upstream_usage import request_upstream_usage
 
 
 def plain_text_truncate_prompt(
-    messages: List[dict], max_prompt_tokens: int, tokenizer: PlainTextTokenizer
+    messages: List[dict],
+    max_prompt_tokens: int,
+    tokenizer: PlainTextTokenizer,
+    tools_tokens: int = 0,
 ) -> Tuple[List[dict], DiscardedMessages, TruncatedTokens]:
     return truncate_prompt(
         messages=messages,
         message_tokens=tokenizer.calculate_message_tokens,
         is_system_message=lambda message: message["role"] == "system",
         max_prompt_tokens=max_prompt_tokens,
-        initial_prompt_tokens=tokenizer.TOKENS_PER_REQUEST,
+        initial_prompt_tokens=tokenizer.TOKENS_PER_REQUEST + tools_tokens,
     )
 
 
@@ -44,6 +64,9 @@ async def gpt_chat_completion(
 ):
     discarded_messages = None
     prompt_tokens = None
+    # The chunks of the upstream stream are relayed without parsing
+    # when the response doesn't need to be transformed
+    is_passthrough = is_passthrough_enabled(deployment_id, data)
     if "max_prompt_tokens" in data:
         max_prompt_tokens = data["max_prompt_tokens"]
         if not isinstance(max_prompt_tokens, int):
@@ -56,29 +79,101 @@ async def gpt_chat_completion(
             )
         del data["max_prompt_tokens"]
 
-        data["messages"], discarded_messages, prompt_tokens = (
-            plain_text_truncate_prompt(
-                messages=cast(List[dict], data["messages"]),
-                max_prompt_tokens=max_prompt_tokens,
-                tokenizer=tokenizer,
+        messages = cast(List[dict], data["messages"])
+        tools_tokens = tokenizer.calculate_tools_tokens(data)
+        if (
+            tokenizer.calculate_prompt_tokens_upper_bound(messages)
+            + tools_tokens
+            <= max_prompt_tokens
+        ):
+            # The prompt surely fits, the exact number of prompt tokens
+            # is calculated only if the upstream doesn't report it
+            discarded_messages = []
+        else:
+            data["messages"], discarded_messages, prompt_tokens = (
+                await run_tokenization(
+                    tokenizer.calculate_prompt_size(messages),
+                    lambda: plain_text_truncate_prompt(
+                        messages=messages,
+                        max_prompt_tokens=max_prompt_tokens,
+                        tokenizer=tokenizer,
+                        tools_tokens=tools_tokens,
+                    ),
+                )
             )
-        )
 
-    client = chat_completions_parser.parse(upstream_endpoint).get_client(
-        {**creds, "api_version": api_version}
-    )
-    response: AsyncStream[ChatCompletionChunk] | ChatCompletion = (
-        await call_with_extra_body(client.chat.completions.create, data)
+    endpoint = chat_completions_parser.parse(upstream_endpoint)
+    client = endpoint.get_client({**creds, "api_version": api_version})
+
+    merge_usage_chunk = request_upstream_usage(
+        data,
+        deployment_id,
+        api_version,
+        is_azure=isinstance(endpoint, AzureOpenAIEndpoint),
     )
 
+    # The usage chunk requested by the adapter has to be merged
+    # into the other chunks, so the stream can't be relayed as it is
+    if is_passthrough and not merge_usage_chunk:
+
+        async def get_passthrough_prompt_tokens() -> int:
+            return await tokenizer.calculate_prompt_tokens_async(
+                data["messages"]
+            ) + tokenizer.calculate_tools_tokens(data)
+
+        return await passthrough_stream(
+            client.chat.completions.with_streaming_response.create(
+                **with_extra_body(client.chat.completions.create, data)
+            ),
+            started_at=monotonic(),
+            get_prompt_tokens=get_passthrough_prompt_tokens,
+            create_token_counter=tokenizer.create_completion_token_counter,
+            deployment=deployment_id,
+        )
+
+    response: AsyncIterator[ChatCompletionChunk] | ChatCompletion
+    started_at = monotonic()
+    if data.get("stream") and is_hedging_enabled(deployment_id):
+        response = await wait_for_stream_start(
+            deployment_id,
+            hedged_stream(
+                deployment_id,
+                lambda: call_with_extra_body(
+                    client.chat.completions.create, {**data}
+                ),
+            ),
+            started_at,
+        )
+    elif data.get("stream"):
+        # The first chunk timeout covers waiting for the response headers
+        response = await wait_for_stream_start(
+            deployment_id,
+            call_with_extra_body(client.chat.completions.create, data),
+            started_at,
+        )
+    else:
+        response = await call_with_extra_body(
+            client.chat.completions.create, data
+        )
+
     if isinstance(response, AsyncIterator):
+
+        async def get_prompt_tokens() -> int:
+            nonlocal prompt_tokens
+            if prompt_tokens is None:
+                prompt_tokens = await tokenizer.calculate_prompt_tokens_async(
+                    data["messages"]
+                ) + tokenizer.calculate_tools_tokens(data)
+            return prompt_tokens
+
         return generate_stream(
-            get_prompt_tokens=lambda: prompt_tokens
-            or tokenizer.calculate_prompt_tokens(data["messages"]),
-            tokenize=tokenizer.calculate_text_tokens,
+            get_prompt_tokens=get_prompt_tokens,
+            create_token_counter=tokenizer.create_completion_token_counter,
             deployment=deployment_id,
             discarded_messages=discarded_messages,
             stream=map_stream(chunk_to_dict, response),
+            merge_usage_chunk=merge_usage_chunk,
+            started_at=started_at,
         )
     else:
         rest = response.to_dict()
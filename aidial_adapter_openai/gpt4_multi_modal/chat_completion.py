@@ -1,4 +1,5 @@
 import os
+from time import monotonic
 from typing import (
     Any,
     AsyncIterator,
@@ -11,12 +12,12 @@ from typing import (
     cast,
 )
 
-import aiohttp
 from aidial_sdk.exceptions import HTTPException as DialException
 from aidial_sdk.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse, Response
 
 from aidial_adapter_openai.dial_api.storage import FileStorage
+from aidial_adapter_openai.env import SPECULATIVE_UPSTREAM_CONNECT
 from aidial_adapter_openai.gpt4_multi_modal.gpt4_vision import (
     convert_gpt4v_to_gpt4_chunk,
 )
@@ -25,6 +26,12 @@ from aidial_adapter_openai.gpt4_multi_modal.transformation import (
     ResourceProcessor,
 )
 from aidial_adapter_openai.utils.auth import OpenAICreds, get_auth_headers
+from aidial_adapter_openai.utils.circuit_breaker import get_retry_headers
+from aidial_adapter_openai.utils.hedging import (
+    hedged_stream,
+    is_hedging_enabled,
+)
+from aidial_adapter_openai.utils.http_client import get_http_client
 from aidial_adapter_openai.utils.log_config import logger
 from aidial_adapter_openai.utils.multi_modal_message import MultiModalMessage
 from aidial_adapter_openai.utils.sse_stream import parse_openai_sse_stream
@@ -34,18 +41,27 @@ from aidial_adapter_openai.utils.streaming import (
     generate_stream,
     map_stream,
     prepend_to_stream,
+    wait_for_stream_start,
+)
+from aidial_adapter_openai.utils.tokenizer import (
+    MultiModalTokenizer,
+    get_tokenizer,
 )
-from aidial_adapter_openai.utils.tokenizer import MultiModalTokenizer
+from aidial_adapter_openai.utils.tokenizer_pool import run_tokenization
 from aidial_adapter_openai.utils.truncate_prompt import (
     DiscardedMessages,
     TruncatedTokens,
     truncate_prompt,
 )
+from aidial_adapter_openai.utils.upstream_usage import request_upstream_usage
+from aidial_adapter_openai.utils.warmup import prefetch_connection
 
 # The built-in default max_tokens is 16 tokens,
 # which is too small for most image-to-text use cases.
 GPT4V_DEFAULT_MAX_TOKENS = int(os.getenv("GPT4_VISION_MAX_TOKENS", "1024"))
 
+GPT4V_TOKENIZER_MODEL = "gpt-4"
+
 USAGE = f"""
 ### Usage
 
@@ -84,35 +100,52 @@ async def predict_stream(
     return await transpose_stream(predict_stream_raw(api_url, headers, request))
 
 
+async def predict_hedged_stream(
+    deployment: str, api_url: str, headers: Dict[str, str], request: Any
+) -> AsyncIterator[bytes] | Response:
+    async def start() -> AsyncIterator[bytes | Response]:
+        return predict_stream_raw(api_url, headers, request)
+
+    # The error responses of the upstream don't win the race
+    return await transpose_stream(
+        await hedged_stream(
+            deployment, start, lambda item: isinstance(item, Response)
+        )
+    )
+
+
 async def predict_stream_raw(
     api_url: str, headers: Dict[str, str], request: Any
 ) -> AsyncIterator[bytes | Response]:
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            api_url, json=request, headers=headers
-        ) as response:
-            if response.status != 200:
-                yield JSONResponse(
-                    status_code=response.status, content=await response.json()
-                )
-                return
+    async with get_http_client(api_url).stream(
+        "POST", api_url, json=request, headers=headers
+    ) as response:
+        if response.status_code != 200:
+            await response.aread()
+            yield JSONResponse(
+                status_code=response.status_code,
+                content=response.json(),
+                headers=get_retry_headers(response.headers),
+            )
+            return
 
-            async for line in response.content:
-                yield line
+        async for data in response.aiter_bytes():
+            yield data
 
 
 async def predict_non_stream(
     api_url: str, headers: Dict[str, str], request: Any
 ) -> dict | JSONResponse:
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            api_url, json=request, headers=headers
-        ) as response:
-            if response.status != 200:
-                return JSONResponse(
-                    status_code=response.status, content=await response.json()
-                )
-            return await response.json()
+    response = await get_http_client(api_url).post(
+        api_url, json=request, headers=headers
+    )
+    if response.status_code != 200:
+        return JSONResponse(
+            status_code=response.status_code,
+            content=response.json(),
+            headers=get_retry_headers(response.headers),
+        )
+    return response.json()
 
 
 def multi_modal_truncate_prompt(
@@ -172,7 +205,7 @@ async def gpt4_vision_chat_completion(
         is_stream,
         file_storage,
         api_version,
-        MultiModalTokenizer("gpt-4"),
+        get_tokenizer(MultiModalTokenizer, GPT4V_TOKENIZER_MODEL),
         convert_gpt4v_to_gpt4_chunk,
         GPT4V_DEFAULT_MAX_TOKENS,
     )
@@ -199,6 +232,11 @@ async def chat_completion(
 
     api_url = f"{upstream_endpoint}?api-version={api_version}"
 
+    # Establishing the upstream connection while the images are being
+    # downloaded and the prompt is being tokenized
+    if SPECULATIVE_UPSTREAM_CONNECT:
+        prefetch_connection(upstream_endpoint)
+
     transform_result = await ResourceProcessor(
         file_storage=file_storage
     ).transform_messages(messages)
@@ -210,26 +248,50 @@ async def chat_completion(
 
     multi_modal_messages = transform_result
     discarded_messages = None
+    estimated_prompt_tokens: Optional[int] = None
     max_prompt_tokens = request.pop("max_prompt_tokens", None)
     if max_prompt_tokens is not None:
-        multi_modal_messages, discarded_messages, estimated_prompt_tokens = (
-            multi_modal_truncate_prompt(
-                messages=multi_modal_messages,
-                max_prompt_tokens=max_prompt_tokens,
-                initial_prompt_tokens=tokenizer.TOKENS_PER_REQUEST,
-                tokenizer=tokenizer,
+        tools_tokens = tokenizer.calculate_tools_tokens(request)
+        if (
+            tokenizer.calculate_prompt_tokens_upper_bound(multi_modal_messages)
+            + tools_tokens
+            <= max_prompt_tokens
+        ):
+            # The prompt surely fits, no need to tokenize it right away
+            discarded_messages = []
+        else:
+            messages_to_truncate = multi_modal_messages
+            (
+                multi_modal_messages,
+                discarded_messages,
+                estimated_prompt_tokens,
+            ) = await run_tokenization(
+                tokenizer.calculate_prompt_size(messages_to_truncate),
+                lambda: multi_modal_truncate_prompt(
+                    messages=messages_to_truncate,
+                    max_prompt_tokens=max_prompt_tokens,
+                    initial_prompt_tokens=tokenizer.TOKENS_PER_REQUEST
+                    + tools_tokens,
+                    tokenizer=tokenizer,
+                ),
             )
-        )
-        logger.debug(
-            f"prompt tokens after truncation: {estimated_prompt_tokens}"
-        )
-    else:
-        estimated_prompt_tokens = tokenizer.calculate_prompt_tokens(
-            multi_modal_messages
-        )
-        logger.debug(
-            f"prompt tokens without truncation: {estimated_prompt_tokens}"
-        )
+            logger.debug(
+                f"prompt tokens after truncation: {estimated_prompt_tokens}"
+            )
+
+    async def get_prompt_tokens() -> int:
+        nonlocal estimated_prompt_tokens
+        if estimated_prompt_tokens is None:
+            estimated_prompt_tokens = (
+                await tokenizer.calculate_prompt_tokens_async(
+                    multi_modal_messages
+                )
+                + tokenizer.calculate_tools_tokens(request)
+            )
+            logger.debug(
+                f"prompt tokens without truncation: {estimated_prompt_tokens}"
+            )
+        return estimated_prompt_tokens
 
     request = {
         **request,
@@ -237,10 +299,28 @@ async def chat_completion(
         "messages": [m.raw_message for m in multi_modal_messages],
     }
 
+    merge_usage_chunk = request_upstream_usage(
+        request, deployment, api_version, is_azure=True
+    )
+
     headers = get_auth_headers(creds)
 
     if is_stream:
-        response = await predict_stream(api_url, headers, request)
+        # The first chunk is read before the stream is returned,
+        # so the first chunk timeout is applied to the whole start
+        started_at = monotonic()
+        if is_hedging_enabled(deployment):
+            response = await wait_for_stream_start(
+                deployment,
+                predict_hedged_stream(deployment, api_url, headers, request),
+                started_at,
+            )
+        else:
+            response = await wait_for_stream_start(
+                deployment,
+                predict_stream(api_url, headers, request),
+                started_at,
+            )
         if isinstance(response, Response):
             return response
 
@@ -253,14 +333,16 @@ async def chat_completion(
         return map_stream(
             debug_print,
             generate_stream(
-                get_prompt_tokens=lambda: estimated_prompt_tokens,
-                tokenize=tokenizer.calculate_text_tokens,
+                get_prompt_tokens=get_prompt_tokens,
+                create_token_counter=tokenizer.create_completion_token_counter,
                 deployment=deployment,
                 discarded_messages=discarded_messages,
                 stream=map_stream(
                     response_transformer,
                     parse_openai_sse_stream(response),
                 ),
+                merge_usage_chunk=merge_usage_chunk,
+                started_at=started_at,
             ),
         )
     else:
@@ -285,13 +367,16 @@ async def chat_completion(
             }
 
         actual_prompt_tokens = usage["prompt_tokens"]
+        estimated_prompt_tokens = await get_prompt_tokens()
         if actual_prompt_tokens != estimated_prompt_tokens:
             logger.warning(
                 f"Estimated prompt tokens ({estimated_prompt_tokens}) don't match the actual ones ({actual_prompt_tokens})"
             )
 
         actual_completion_tokens = usage["completion_tokens"]
-        estimated_completion_tokens = tokenizer.calculate_text_tokens(content)
+        estimated_completion_tokens = (
+            await tokenizer.calculate_text_tokens_async(content)
+        )
         if actual_completion_tokens != estimated_completion_tokens:
             logger.warning(
                 f"Estimated completion tokens ({estimated_completion_tokens}) don't match the actual ones ({actual_completion_tokens})"
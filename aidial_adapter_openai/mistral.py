@@ -5,6 +5,10 @@ from openai.types.chat.chat_completion import ChatCompletion
 from openai.types.chat.chat_completion_chunk import ChatCompletionChunk
 
 from aidial_adapter_openai.utils.auth import OpenAICreds
+from aidial_adapter_openai.utils.client_cache import (
+    fingerprint,
+    openai_client_cache,
+)
 from aidial_adapter_openai.utils.http_client import get_http_client
 from aidial_adapter_openai.utils.reflection import call_with_extra_body
 from aidial_adapter_openai.utils.streaming import chunk_to_dict, map_stream
@@ -13,10 +17,13 @@ from aidial_adapter_openai.utils.streaming import chunk_to_dict, map_stream
 async def chat_completion(
     data: Any, upstream_endpoint: str, creds: OpenAICreds
 ):
-    client = AsyncOpenAI(
-        base_url=upstream_endpoint,
-        api_key=creds.get("api_key"),
-        http_client=get_http_client(),
+    client = openai_client_cache.get(
+        ("mistral", upstream_endpoint, fingerprint(creds.get("api_key"))),
+        lambda: AsyncOpenAI(
+            base_url=upstream_endpoint,
+            api_key=creds.get("api_key"),
+            http_client=get_http_client(upstream_endpoint),
+        ),
     )
 
     response: AsyncStream[ChatCompletionChunk] | ChatCompletion = (
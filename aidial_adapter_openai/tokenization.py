@@ -0,0 +1,241 @@
+"""
+Batch /tokenize and /truncate_prompt endpoints.
+
+The endpoints allow to size and plan prompts without calling the upstream model.
+"""
+
+import asyncio
+from typing import Annotated, Any, List, Optional, Type, TypeVar
+
+from aidial_sdk.chat_completion.request import ChatCompletionRequest
+from aidial_sdk.deployment.tokenize import (
+    TokenizeError,
+    TokenizeInput,
+    TokenizeInputRequest,
+    TokenizeInputString,
+    TokenizeOutput,
+    TokenizeResponse,
+    TokenizeSuccess,
+)
+from aidial_sdk.deployment.truncate_prompt import (
+    TruncatePromptError,
+    TruncatePromptResponse,
+    TruncatePromptResult,
+    TruncatePromptSuccess,
+)
+from aidial_sdk.exceptions import HTTPException as DialException
+from aidial_sdk.exceptions import InvalidRequestError, ResourceNotFoundError
+from pydantic import Field, ValidationError, parse_obj_as
+
+from aidial_adapter_openai.dial_api.storage import FileStorage
+from aidial_adapter_openai.env import (
+    DALLE3_DEPLOYMENTS,
+    DATABRICKS_DEPLOYMENTS,
+    GPT4_VISION_DEPLOYMENTS,
+    GPT4O_DEPLOYMENTS,
+    MISTRAL_DEPLOYMENTS,
+    MODEL_ALIASES,
+)
+from aidial_adapter_openai.gpt import plain_text_truncate_prompt
+from aidial_adapter_openai.gpt4_multi_modal.chat_completion import (
+    GPT4V_TOKENIZER_MODEL,
+    multi_modal_truncate_prompt,
+)
+from aidial_adapter_openai.gpt4_multi_modal.transformation import (
+    ResourceProcessor,
+)
+from aidial_adapter_openai.utils.multi_modal_message import MultiModalMessage
+from aidial_adapter_openai.utils.tokenizer import (
+    MultiModalTokenizer,
+    PlainTextTokenizer,
+    get_tokenizer,
+)
+from aidial_adapter_openai.utils.tokenizer_pool import run_tokenization
+
+DeploymentTokenizer = PlainTextTokenizer | MultiModalTokenizer
+
+_TokenizeInput = Annotated[TokenizeInput, Field(discriminator="type")]
+
+# The locations of the union itself and its members in the validation errors
+_UNION_LOCS = {
+    "__root__",
+    TokenizeInputRequest.__name__,
+    TokenizeInputString.__name__,
+}
+
+_T = TypeVar("_T")
+
+
+def get_deployment_tokenizer(deployment_id: str) -> DeploymentTokenizer:
+    if deployment_id in GPT4_VISION_DEPLOYMENTS:
+        return get_tokenizer(MultiModalTokenizer, GPT4V_TOKENIZER_MODEL)
+
+    openai_model_name = MODEL_ALIASES.get(deployment_id, deployment_id)
+    if deployment_id in GPT4O_DEPLOYMENTS:
+        return get_tokenizer(MultiModalTokenizer, openai_model_name)
+
+    return get_tokenizer(PlainTextTokenizer, openai_model_name)
+
+
+def _get_tokenizer_for_endpoint(
+    deployment_id: str, endpoint: str
+) -> DeploymentTokenizer:
+    if (
+        deployment_id in DALLE3_DEPLOYMENTS
+        or deployment_id in MISTRAL_DEPLOYMENTS
+        or deployment_id in DATABRICKS_DEPLOYMENTS
+    ):
+        raise ResourceNotFoundError(
+            f"The deployment doesn't support /{endpoint} endpoint"
+        )
+    return get_deployment_tokenizer(deployment_id)
+
+
+def _get_inputs(body: dict) -> List[Any]:
+    inputs = body.get("inputs")
+    if not isinstance(inputs, list):
+        raise InvalidRequestError("'inputs' must be a list")
+    return inputs
+
+
+def _parse_input(model: Type[_T], input: Any) -> _T:
+    """
+    The inputs are validated one by one, so that an invalid input
+    is reported in its output instead of failing the whole batch
+    """
+    try:
+        return parse_obj_as(model, input)
+    except ValidationError as e:
+        errors = []
+        for error in e.errors():
+            loc = ".".join(
+                str(item) for item in error["loc"] if item not in _UNION_LOCS
+            )
+            errors.append(f"{loc}: {error['msg']}" if loc else error["msg"])
+        raise InvalidRequestError(f"Invalid input: {'; '.join(errors)}")
+
+
+async def _get_messages(
+    tokenizer: DeploymentTokenizer,
+    request: dict,
+    file_storage: Optional[FileStorage],
+) -> List[dict] | List[MultiModalMessage]:
+    messages = request["messages"]
+    if isinstance(tokenizer, PlainTextTokenizer):
+        return messages
+
+    result = await ResourceProcessor(
+        file_storage=file_storage
+    ).transform_messages(messages)
+    if isinstance(result, DialException):
+        raise result
+    return result
+
+
+async def _count_request_tokens(
+    tokenizer: DeploymentTokenizer,
+    request: dict,
+    file_storage: Optional[FileStorage],
+) -> int:
+    messages = await _get_messages(tokenizer, request, file_storage)
+    return await tokenizer.calculate_prompt_tokens_async(
+        messages  # type: ignore
+    ) + tokenizer.calculate_tools_tokens(request)
+
+
+async def _tokenize_input(
+    tokenizer: DeploymentTokenizer,
+    input: Any,
+    file_storage: Optional[FileStorage],
+) -> TokenizeOutput:
+    try:
+        parsed = _parse_input(_TokenizeInput, input)
+        if isinstance(parsed, TokenizeInputString):
+            token_count = await tokenizer.calculate_text_tokens_async(
+                parsed.value
+            )
+        else:
+            # The original request is tokenized, since the parsed one
+            # is populated with the default values
+            token_count = await _count_request_tokens(
+                tokenizer, input["value"], file_storage
+            )
+    except DialException as e:
+        return TokenizeError(error=e.message)
+
+    return TokenizeSuccess(token_count=token_count)
+
+
+async def _truncate_request(
+    tokenizer: DeploymentTokenizer,
+    request: Any,
+    file_storage: Optional[FileStorage],
+) -> TruncatePromptResult:
+    try:
+        max_prompt_tokens = _parse_input(
+            ChatCompletionRequest, request
+        ).max_prompt_tokens
+        if max_prompt_tokens is None:
+            raise InvalidRequestError(
+                "'max_prompt_tokens' must be a positive integer"
+            )
+
+        messages = await _get_messages(tokenizer, request, file_storage)
+        tools_tokens = tokenizer.calculate_tools_tokens(request)
+
+        if (
+            tokenizer.calculate_prompt_tokens_upper_bound(messages)  # type: ignore
+            + tools_tokens
+            <= max_prompt_tokens
+        ):
+            return TruncatePromptSuccess(discarded_messages=[])
+
+        if isinstance(tokenizer, PlainTextTokenizer):
+            plain_messages: List[dict] = messages  # type: ignore
+            truncate = lambda: plain_text_truncate_prompt(  # noqa: E731
+                messages=plain_messages,
+                max_prompt_tokens=max_prompt_tokens,
+                tokenizer=tokenizer,
+                tools_tokens=tools_tokens,
+            )
+        else:
+            multi_modal_messages: List[MultiModalMessage] = messages  # type: ignore
+            truncate = lambda: multi_modal_truncate_prompt(  # noqa: E731
+                messages=multi_modal_messages,
+                max_prompt_tokens=max_prompt_tokens,
+                initial_prompt_tokens=tokenizer.TOKENS_PER_REQUEST
+                + tools_tokens,
+                tokenizer=tokenizer,
+            )
+
+        _, discarded_messages, _ = await run_tokenization(
+            tokenizer.calculate_prompt_size(messages), truncate  # type: ignore
+        )
+    except DialException as e:
+        return TruncatePromptError(error=e.message)
+
+    return TruncatePromptSuccess(discarded_messages=discarded_messages)
+
+
+async def tokenize(
+    deployment_id: str, body: dict, file_storage: Optional[FileStorage]
+) -> TokenizeResponse:
+    inputs = _get_inputs(body)
+    tokenizer = _get_tokenizer_for_endpoint(deployment_id, "tokenize")
+
+    outputs = await asyncio.gather(
+        *[_tokenize_input(tokenizer, input, file_storage) for input in inputs]
+    )
+    return TokenizeResponse(outputs=outputs)
+
+
+async def truncate_prompt(
+    deployment_id: str, body: dict, file_storage: Optional[FileStorage]
+) -> TruncatePromptResponse:
+    inputs = _get_inputs(body)
+    tokenizer = _get_tokenizer_for_endpoint(deployment_id, "truncate_prompt")
+
+    outputs = await asyncio.gather(
+        *[_truncate_request(tokenizer, input, file_storage) for input in inputs]
+    )
+    return TruncatePromptResponse(outputs=outputs)
@@ -0,0 +1,211 @@
+"""
+Per-upstream circuit breaker.
+
+The breaker opens when the upstream either reports a rate limit reset window
+or fails a number of times in a row. While the breaker is open,
+the requests to the upstream are rejected right away,
+so that DIAL Core could fail over to another upstream.
+"""
+
+import math
+import os
+import re
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Mapping, Optional, TypeVar
+
+import aiohttp
+import httpx
+from aidial_sdk.exceptions import HTTPException as DialException
+from fastapi.responses import Response
+from openai import APIConnectionError, APIStatusError
+
+from aidial_adapter_openai.utils.env import get_env_bool
+from aidial_adapter_openai.utils.log_config import logger
+
+CIRCUIT_BREAKER_ENABLED = get_env_bool("CIRCUIT_BREAKER_ENABLED", False)
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(
+    os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5")
+)
+CIRCUIT_BREAKER_COOLDOWN = float(os.getenv("CIRCUIT_BREAKER_COOLDOWN", "10"))
+
+# The headers which are relayed to the client when the upstream rejects a request
+RETRY_HEADERS_PATTERN = re.compile(r"^(retry-after|x-ratelimit-reset)")
+
+_DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+class CircuitOpenError(DialException):
+    retry_after: float
+
+    def __init__(self, status_code: int, retry_after: float) -> None:
+        self.retry_after = retry_after
+        super().__init__(
+            status_code=status_code,
+            type="upstream_unavailable",
+            message="The upstream endpoint is temporarily unavailable",
+            display_message="The model is temporarily unavailable. Please try again later.",
+        )
+
+    def to_fastapi_response(self):
+        response = super().to_fastapi_response()
+        response.headers["Retry-After"] = str(math.ceil(self.retry_after))
+        return response
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    """
+    Parses durations in the format of OpenAI rate limit headers, e.g. "1s", "6m0s", "20ms".
+    """
+    value = value.strip()
+    if not value:
+        return None
+
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    matches = _DURATION_PATTERN.findall(value)
+    if not matches or "".join(n + u for n, u in matches) != value:
+        return None
+
+    return sum(float(n) * _DURATION_UNITS[u] for n, u in matches)
+
+
+def get_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    headers = {k.lower(): v for k, v in headers.items()}
+
+    if (value := headers.get("retry-after-ms")) is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+
+    if (value := headers.get("retry-after")) is not None:
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                pass
+
+    resets = [
+        duration
+        for name in ["x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"]
+        if (value := headers.get(name)) is not None
+        and (duration := _parse_duration(value)) is not None
+    ]
+
+    return max(resets) if resets else None
+
+
+def get_retry_headers(headers: Mapping[str, str]) -> Dict[str, str]:
+    return {
+        name: value
+        for name, value in headers.items()
+        if RETRY_HEADERS_PATTERN.match(name.lower())
+    }
+
+
+class CircuitBreaker:
+    failure_threshold: int
+    cooldown: float
+
+    consecutive_failures: int
+    open_until: float
+    status_code: int
+
+    def __init__(self, failure_threshold: int, cooldown: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.status_code = 503
+
+    def check(self) -> None:
+        retry_after = self.open_until - time.monotonic()
+        if retry_after > 0:
+            raise CircuitOpenError(self.status_code, retry_after)
+
+    def _open(self, status_code: int, duration: float) -> None:
+        self.status_code = status_code
+        self.open_until = max(self.open_until, time.monotonic() + duration)
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+
+    def record_failure(self, status_code: int = 503) -> None:
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failure_threshold:
+            self._open(status_code, self.cooldown)
+
+    def record_status(self, status_code: int, headers: Mapping[str, str]):
+        if status_code < 400:
+            self.record_success()
+            return
+
+        retry_after = get_retry_after(headers)
+
+        if status_code == 429 or status_code >= 500:
+            if retry_after is not None and retry_after > 0:
+                self._open(429 if status_code == 429 else 503, retry_after)
+            self.record_failure(429 if status_code == 429 else 503)
+        else:
+            # The upstream is responsive, it's the request which is invalid
+            self.record_success()
+
+    def record_exception(self, e: Exception) -> None:
+        if isinstance(e, APIStatusError):
+            self.record_status(e.status_code, e.response.headers)
+        elif isinstance(
+            e,
+            (APIConnectionError, httpx.TransportError, aiohttp.ClientError),
+        ):
+            self.record_failure()
+
+
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(upstream_endpoint: str) -> CircuitBreaker:
+    key = upstream_endpoint.split("?", 1)[0]
+    breaker = _circuit_breakers.get(key)
+    if breaker is None:
+        breaker = _circuit_breakers[key] = CircuitBreaker(
+            failure_threshold=CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+            cooldown=CIRCUIT_BREAKER_COOLDOWN,
+        )
+    return breaker
+
+
+_T = TypeVar("_T")
+
+
+async def call_with_circuit_breaker(
+    upstream_endpoint: str, func: Callable[[], Awaitable[_T]]
+) -> _T:
+    if not CIRCUIT_BREAKER_ENABLED:
+        return await func()
+
+    breaker = get_circuit_breaker(upstream_endpoint)
+    breaker.check()
+
+    try:
+        response = await func()
+    except Exception as e:
+        breaker.record_exception(e)
+        if breaker.open_until > time.monotonic():
+            logger.warning(
+                f"Circuit breaker is open for the upstream {upstream_endpoint!r}"
+            )
+        raise
+
+    if isinstance(response, Response):
+        breaker.record_status(response.status_code, response.headers)
+    else:
+        breaker.record_success()
+
+    return response
@@ -0,0 +1,84 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Optional, Tuple, TypeVar
+
+from openai import AsyncOpenAI
+
+_Client = TypeVar("_Client")
+
+
+class ClientCache(Generic[_Client]):
+    """
+    LRU cache of OpenAI SDK clients.
+
+    The entries which weren't used for `idle_timeout` seconds are evicted.
+    The evicted clients aren't closed, since all of them share
+    the same underlying HTTP client.
+    """
+
+    max_size: int
+    idle_timeout: float
+
+    _entries: "OrderedDict[Hashable, Tuple[_Client, float]]"
+
+    def __init__(self, max_size: int, idle_timeout: float) -> None:
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._entries = OrderedDict()
+
+    def get(self, key: Hashable, create: Callable[[], _Client]) -> _Client:
+        now = time.monotonic()
+        self._evict_idle(now)
+
+        if self.max_size <= 0:
+            return create()
+
+        if (entry := self._entries.get(key)) is not None:
+            client = entry[0]
+            self._entries.move_to_end(key)
+        else:
+            client = create()
+            while len(self._entries) >= self.max_size:
+                self._entries.popitem(last=False)
+
+        self._entries[key] = (client, now)
+        return client
+
+    def _evict_idle(self, now: float) -> None:
+        # The entries are ordered by the time of last use
+        while self._entries:
+            key, (_, last_used) = next(iter(self._entries.items()))
+            if now - last_used < self.idle_timeout:
+                break
+            del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+def fingerprint(secret: Optional[str]) -> Optional[str]:
+    """
+    The credentials are part of the cache key.
+    A digest is stored instead of the secret itself.
+    When an Azure AD token rotates, its digest changes too,
+    so a new client is created and the stale one is eventually evicted.
+    """
+    if secret is None:
+        return None
+    return hashlib.sha256(secret.encode()).hexdigest()
+
+
+OPENAI_CLIENT_CACHE_SIZE = int(os.getenv("OPENAI_CLIENT_CACHE_SIZE", "256"))
+OPENAI_CLIENT_CACHE_IDLE_TIMEOUT = float(
+    os.getenv("OPENAI_CLIENT_CACHE_IDLE_TIMEOUT", "600")
+)
+
+openai_client_cache: ClientCache[AsyncOpenAI] = ClientCache(
+    max_size=OPENAI_CLIENT_CACHE_SIZE,
+    idle_timeout=OPENAI_CLIENT_CACHE_IDLE_TIMEOUT,
+)
@@ -0,0 +1,216 @@
+"""
+DNS cache shared by the httpx clients and the aiohttp session.
+
+The system resolver doesn't report TTL of the records,
+so the entries are kept for a configured period of time.
+"""
+
+import asyncio
+import ipaddress
+import os
+import socket
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import httpcore
+from aiohttp.abc import AbstractResolver, ResolveResult
+
+from aidial_adapter_openai.utils.metrics import meter
+
+DNS_CACHE_TTL = float(os.getenv("DNS_CACHE_TTL", "10"))
+DNS_CACHE_MAX_SIZE = int(os.getenv("DNS_CACHE_MAX_SIZE", "1000"))
+
+AddrInfo = Tuple[socket.AddressFamily, socket.SocketKind, int, str, Any]
+
+_Key = Tuple[str, int, int]
+
+# The counters aren't labelled with the host names,
+# since the hosts of the user attachments are arbitrary
+_hits_counter = meter.create_counter(
+    "dns_cache.hits", description="Number of DNS lookups served from cache"
+)
+_misses_counter = meter.create_counter(
+    "dns_cache.misses", description="Number of DNS lookups sent to resolver"
+)
+
+
+class DNSCache:
+    ttl: float
+    max_size: int
+    hits: int
+    misses: int
+
+    _entries: Dict[_Key, Tuple[float, List[AddrInfo]]]
+    _pending: Dict[_Key, "asyncio.Future[List[AddrInfo]]"]
+
+    def __init__(self, ttl: float, max_size: int = DNS_CACHE_MAX_SIZE) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._pending = {}
+
+    async def getaddrinfo(
+        self, host: str, port: int, family: int = socket.AF_UNSPEC
+    ) -> List[AddrInfo]:
+        key = (host, port, family)
+
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            _hits_counter.add(1)
+            return entry[1]
+
+        self.misses += 1
+        _misses_counter.add(1)
+
+        # Concurrent lookups of the same host are coalesced into one
+        if (pending := self._pending.get(key)) is None:
+            pending = self._pending[key] = asyncio.ensure_future(
+                self._resolve(key)
+            )
+            pending.add_done_callback(lambda _: self._pending.pop(key, None))
+
+        return await asyncio.shield(pending)
+
+    async def _resolve(self, key: _Key) -> List[AddrInfo]:
+        host, port, family = key
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            host,
+            port,
+            family=family,
+            type=socket.SOCK_STREAM,
+            flags=socket.AI_ADDRCONFIG,
+        )
+
+        if self.ttl > 0 and self.max_size > 0:
+            self._entries.pop(key, None)
+            if len(self._entries) >= self.max_size:
+                self._evict()
+            self._entries[key] = (time.monotonic() + self.ttl, infos)
+
+        return infos
+
+    def _evict(self) -> None:
+        """
+        Removes the expired entries and, if the cache is still full,
+        the oldest ones, since the hosts of the user attachments are arbitrary.
+        """
+        now = time.monotonic()
+        for key in [
+            key for key, (expires, _) in self._entries.items() if expires <= now
+        ]:
+            del self._entries[key]
+
+        # The entries are ordered by the time of resolution
+        while len(self._entries) >= self.max_size:
+            del self._entries[next(iter(self._entries))]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+def _is_ip_address(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+class CachingResolver(AbstractResolver):
+    """
+    aiohttp resolver backed by the shared DNS cache.
+    """
+
+    def __init__(self, cache: DNSCache) -> None:
+        self._cache = cache
+
+    async def resolve(
+        self, host: str, port: int = 0, family: int = socket.AF_INET
+    ) -> List[ResolveResult]:
+        infos = await self._cache.getaddrinfo(host, port, family)
+
+        return [
+            ResolveResult(
+                hostname=host,
+                host=address[0],
+                port=address[1],
+                family=info_family,
+                proto=proto,
+                flags=socket.AI_NUMERICHOST | socket.AI_NUMERICSERV,
+            )
+            for info_family, _, proto, _, address in infos
+        ]
+
+    async def close(self) -> None:
+        pass
+
+
+class CachingNetworkBackend(httpcore.AsyncNetworkBackend):
+    """
+    httpcore network backend which resolves the host names via the shared DNS cache.
+    TLS verification and SNI still use the original host name,
+    since httpcore passes it to `start_tls` separately.
+    """
+
+    def __init__(
+        self,
+        cache: DNSCache,
+        backend: Optional[httpcore.AsyncNetworkBackend] = None,
+    ) -> None:
+        self._cache = cache
+        self._backend = backend or httpcore.AnyIOBackend()
+
+    async def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: Optional[float] = None,
+        local_address: Optional[str] = None,
+        socket_options: Optional[Iterable[httpcore.SOCKET_OPTION]] = None,
+    ) -> httpcore.AsyncNetworkStream:
+        if _is_ip_address(host):
+            return await self._backend.connect_tcp(
+                host, port, timeout, local_address, socket_options
+            )
+
+        try:
+            infos = await asyncio.wait_for(
+                self._cache.getaddrinfo(host, port), timeout
+            )
+        except asyncio.TimeoutError as e:
+            raise httpcore.ConnectTimeout(str(e)) from e
+        except OSError as e:
+            raise httpcore.ConnectError(str(e)) from e
+
+        error: Exception = httpcore.ConnectError(f"Can't resolve {host!r}")
+        for *_, address in infos:
+            try:
+                return await self._backend.connect_tcp(
+                    address[0], port, timeout, local_address, socket_options
+                )
+            except httpcore.ConnectError as e:
+                error = e
+
+        raise error
+
+    async def connect_unix_socket(
+        self,
+        path: str,
+        timeout: Optional[float] = None,
+        socket_options: Optional[Iterable[httpcore.SOCKET_OPTION]] = None,
+    ) -> httpcore.AsyncNetworkStream:
+        return await self._backend.connect_unix_socket(
+            path, timeout, socket_options
+        )
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+dns_cache = DNSCache(ttl=DNS_CACHE_TTL, max_size=DNS_CACHE_MAX_SIZE)
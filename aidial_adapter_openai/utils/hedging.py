@@ -0,0 +1,246 @@
+"""
+Hedged upstream requests.
+
+When the first chunk of a stream doesn't arrive within the delay derived from
+the recently observed time-to-first-chunk, a duplicate request is sent.
+The stream which yields its first chunk earlier is returned to the caller,
+the other one is cancelled and closed.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from aidial_adapter_openai.utils.log_config import logger
+from aidial_adapter_openai.utils.metrics import meter
+from aidial_adapter_openai.utils.parsers import parse_deployment_list
+from aidial_adapter_openai.utils.streaming import prepend_to_stream
+
+HEDGING_DEPLOYMENTS = parse_deployment_list(os.getenv("HEDGING_DEPLOYMENTS"))
+HEDGING_PERCENTILE = float(os.getenv("HEDGING_PERCENTILE", "95"))
+HEDGING_DEFAULT_DELAY = float(os.getenv("HEDGING_DEFAULT_DELAY", "2"))
+HEDGING_MIN_DELAY = float(os.getenv("HEDGING_MIN_DELAY", "0.1"))
+HEDGING_BUDGET = float(os.getenv("HEDGING_BUDGET", "0.05"))
+
+# The number of recent time-to-first-chunk samples kept per deployment
+_WINDOW_SIZE = 200
+# The percentile isn't reliable until enough samples are collected
+_MIN_SAMPLES = 20
+# The maximum number of hedges which could be sent in a burst
+_BUDGET_CAPACITY = 10.0
+
+_hedges_counter = meter.create_counter(
+    "hedging.hedges", description="Number of duplicate upstream requests sent"
+)
+_wins_counter = meter.create_counter(
+    "hedging.wins", description="Number of hedges which answered first"
+)
+_losses_counter = meter.create_counter(
+    "hedging.losses", description="Number of hedges which lost the race"
+)
+
+_T = TypeVar("_T")
+
+
+class LatencyTracker:
+    samples: Deque[float]
+
+    def __init__(self) -> None:
+        self.samples = deque(maxlen=_WINDOW_SIZE)
+
+    def add(self, latency: float) -> None:
+        self.samples.append(latency)
+
+    def hedging_delay(self) -> float:
+        if len(self.samples) < _MIN_SAMPLES:
+            return HEDGING_DEFAULT_DELAY
+
+        ordered = sorted(self.samples)
+        idx = round(HEDGING_PERCENTILE / 100 * (len(ordered) - 1))
+        return max(HEDGING_MIN_DELAY, ordered[idx])
+
+
+class HedgingBudget:
+    """
+    Token bucket which limits the share of hedged requests.
+    Each request adds `ratio` tokens, each hedge consumes a single token.
+    """
+
+    ratio: float
+    tokens: float
+
+    def __init__(self, ratio: float) -> None:
+        self.ratio = ratio
+        self.tokens = 1.0
+
+    def on_request(self) -> None:
+        self.tokens = min(_BUDGET_CAPACITY, self.tokens + self.ratio)
+
+    def try_acquire(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+_trackers: Dict[str, LatencyTracker] = {}
+_budgets: Dict[str, HedgingBudget] = {}
+
+
+def is_hedging_enabled(deployment: str) -> bool:
+    return deployment in HEDGING_DEPLOYMENTS
+
+
+class _End:
+    pass
+
+
+_END = _End()
+
+# The stream, its iterator, the first item and the time it was received at
+_Attempt = Tuple[AsyncIterable[_T], AsyncIterator[_T], Any, float]
+
+
+async def _attempt(
+    start: Callable[[], Awaitable[AsyncIterable[_T]]]
+) -> "_Attempt[_T]":
+    stream = await start()
+    iterator = aiter(stream)
+    try:
+        first = await anext(iterator, _END)
+    except BaseException:
+        await _close_stream(stream)
+        raise
+    return stream, iterator, first, time.monotonic()
+
+
+async def _close_stream(stream: Any) -> None:
+    if (aclose := getattr(stream, "aclose", None)) is not None:
+        await aclose()
+    elif (close := getattr(stream, "close", None)) is not None:
+        await close()
+
+
+async def _discard(task: "asyncio.Task[_Attempt]") -> None:
+    if not task.done():
+        task.cancel()
+
+    try:
+        stream, _, _, _ = await task
+    except BaseException:
+        return
+
+    await _close_stream(stream)
+
+
+async def _empty_stream() -> AsyncIterator[Any]:
+    return
+    yield
+
+
+async def hedged_stream(
+    deployment: str,
+    start: Callable[[], Awaitable[AsyncIterable[_T]]],
+    is_error: Optional[Callable[[_T], bool]] = None,
+) -> AsyncIterator[_T]:
+    """
+    Calls `start` to open an upstream stream.
+    If the first item of the stream doesn't arrive in time and the budget allows,
+    `start` is called once again and the stream which answers first is returned.
+
+    The attempts whose first item satisfies `is_error` are considered failed,
+    such a stream is returned only if none of the attempts succeeds.
+    """
+    tracker = _trackers.setdefault(deployment, LatencyTracker())
+    budget = _budgets.setdefault(deployment, HedgingBudget(HEDGING_BUDGET))
+    budget.on_request()
+    started_at = time.monotonic()
+
+    tasks: List[asyncio.Task[_Attempt[_T]]] = [
+        asyncio.create_task(_attempt(start))
+    ]
+    winner: Optional[asyncio.Task[_Attempt[_T]]] = None
+
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=tracker.hedging_delay())
+        if not done and budget.try_acquire():
+            logger.debug(f"Sending a hedged request to {deployment!r}")
+            _hedges_counter.add(1, {"deployment": deployment})
+            tasks.append(asyncio.create_task(_attempt(start)))
+
+        winner = await _first_successful(tasks, is_error)
+    finally:
+        # Cancelling the pending attempts and closing the streams of
+        # the completed ones, so that they don't keep generating tokens
+        losers = [task for task in tasks if task is not winner]
+        await asyncio.gather(*map(_discard, losers))
+
+    if len(tasks) > 1:
+        counter = _wins_counter if winner is tasks[1] else _losses_counter
+        counter.add(1, {"deployment": deployment})
+
+    _, iterator, first, received_at = winner.result()
+    if not _is_failed_attempt(winner, is_error):
+        # The time-to-first-chunk is measured from the original request.
+        # When the hedge wins, it's the lower bound of the primary latency,
+        # so the slow primaries still raise the percentile.
+        tracker.add(received_at - started_at)
+
+    if first is _END:
+        return _empty_stream()
+
+    return prepend_to_stream(first, iterator)
+
+
+def _is_failed_attempt(
+    task: "asyncio.Task[_Attempt[_T]]",
+    is_error: Optional[Callable[[_T], bool]],
+) -> bool:
+    if task.exception() is not None:
+        return True
+    _, _, first, _ = task.result()
+    return is_error is not None and first is not _END and is_error(first)
+
+
+async def _first_successful(
+    tasks: List["asyncio.Task[_Attempt[_T]]"],
+    is_error: Optional[Callable[[_T], bool]],
+) -> "asyncio.Task[_Attempt[_T]]":
+    pending = set(tasks)
+    error: Optional[BaseException] = None
+    # The attempt which returned an error response instead of the stream
+    error_response: Optional[asyncio.Task[_Attempt[_T]]] = None
+
+    while pending:
+        done, pending = await asyncio.wait(
+            pending, return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in tasks:
+            if task not in done:
+                continue
+            if not _is_failed_attempt(task, is_error):
+                return task
+            if task.exception() is None:
+                error_response = error_response or task
+            elif error is None:
+                error = task.exception()
+
+    if error_response is not None:
+        return error_response
+
+    assert error is not None
+    raise error
@@ -1,6 +1,22 @@
-import functools
+import importlib.util
+import json
+import os
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlparse
 
+import aiohttp
 import httpx
+from httpx._utils import get_environment_proxies
+from opentelemetry.metrics import CallbackOptions, Observation
+from pydantic import BaseModel
+
+from aidial_adapter_openai.utils.dns_cache import (
+    CachingNetworkBackend,
+    CachingResolver,
+    dns_cache,
+)
+from aidial_adapter_openai.utils.log_config import logger
+from aidial_adapter_openai.utils.metrics import meter
 
 # connect timeout and total timeout
 DEFAULT_TIMEOUT = httpx.Timeout(600, connect=10)
@@ -11,10 +27,212 @@ DEFAULT_CONNECTION_LIMITS = httpx.Limits(
 )
 
 
-@functools.cache
-def get_http_client() -> httpx.AsyncClient:
-    return httpx.AsyncClient(
-        timeout=DEFAULT_TIMEOUT,
-        limits=DEFAULT_CONNECTION_LIMITS,
-        follow_redirects=True,
+class PoolConfig(BaseModel):
+    max_connections: Optional[int] = DEFAULT_CONNECTION_LIMITS.max_connections
+    max_keepalive_connections: Optional[int] = (
+        DEFAULT_CONNECTION_LIMITS.max_keepalive_connections
     )
+    keepalive_expiry: Optional[float] = (
+        DEFAULT_CONNECTION_LIMITS.keepalive_expiry
+    )
+    http2: bool = False
+
+    @property
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+
+DEFAULT_POOL_KEY = "*"
+
+# Connection pool settings per upstream host (optionally with port).
+# The "*" key overrides the settings of the hosts which aren't listed.
+HTTP_CLIENT_POOLS: Dict[str, PoolConfig] = {
+    host.lower(): PoolConfig.parse_obj(config)
+    for host, config in json.loads(
+        os.getenv("HTTP_CLIENT_POOLS") or "{}"
+    ).items()
+}
+
+
+def get_pool_key(url: Optional[str]) -> str:
+    if not url:
+        return DEFAULT_POOL_KEY
+    return urlparse(url).netloc.lower() or DEFAULT_POOL_KEY
+
+
+def get_pool_config(pool_key: str) -> PoolConfig:
+    if (config := HTTP_CLIENT_POOLS.get(pool_key)) is not None:
+        return config
+
+    hostname = pool_key.rsplit(":", 1)[0]
+    if (config := HTTP_CLIENT_POOLS.get(hostname)) is not None:
+        return config
+
+    return HTTP_CLIENT_POOLS.get(DEFAULT_POOL_KEY) or PoolConfig()
+
+
+def _is_http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def _create_transport(
+    limits: httpx.Limits, http2: bool
+) -> httpx.AsyncHTTPTransport:
+    """
+    The transport for the direct connections which resolves
+    the host names via the shared DNS cache.
+    """
+    transport = httpx.AsyncHTTPTransport(limits=limits, http2=http2)
+    # httpx doesn't allow to configure the network backend of the transport
+    transport._pool._network_backend = CachingNetworkBackend(dns_cache)
+    return transport
+
+
+def _get_proxy_mounts(
+    limits: httpx.Limits, http2: bool
+) -> Dict[str, Optional[httpx.AsyncBaseTransport]]:
+    """
+    httpx ignores the proxy environment variables (HTTP(S)_PROXY, NO_PROXY, etc.)
+    when the client is given a custom transport, so the proxies are mounted explicitly.
+    The hosts excluded by NO_PROXY are mounted to None,
+    which routes them to the default transport.
+    """
+    return {
+        pattern: (
+            None
+            if proxy is None
+            else httpx.AsyncHTTPTransport(
+                proxy=proxy, limits=limits, http2=http2
+            )
+        )
+        for pattern, proxy in get_environment_proxies().items()
+    }
+
+
+_http_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def get_http_client(url: Optional[str] = None) -> httpx.AsyncClient:
+    """
+    Returns the HTTP client with the connection pool dedicated
+    to the host of the given URL, so that a slow upstream
+    doesn't exhaust the connections used by the other upstreams.
+    """
+    pool_key = get_pool_key(url)
+
+    client = _http_clients.get(pool_key)
+    if client is None or client.is_closed:
+        config = get_pool_config(pool_key)
+
+        http2 = config.http2
+        if http2 and not _is_http2_available():
+            logger.warning(
+                f"HTTP/2 is enabled for {pool_key!r}, but the 'h2' package isn't installed. "
+                "Falling back to HTTP/1.1."
+            )
+            http2 = False
+
+        client = _http_clients[pool_key] = httpx.AsyncClient(
+            timeout=DEFAULT_TIMEOUT,
+            transport=_create_transport(config.limits, http2),
+            mounts=_get_proxy_mounts(config.limits, http2),
+            follow_redirects=True,
+        )
+
+    return client
+
+
+class PoolStats(BaseModel):
+    max_connections: Optional[int]
+    connections: int
+    idle_connections: int
+    queued_requests: int
+
+
+def _get_client_pool_stats(
+    pool_key: str, client: httpx.AsyncClient
+) -> Optional[PoolStats]:
+    # httpx doesn't expose the underlying httpcore pool publicly
+    pool = getattr(client._transport, "_pool", None)
+    if pool is None:
+        return None
+
+    connections: List = list(pool.connections)
+    requests: List = list(getattr(pool, "_requests", []))
+
+    return PoolStats(
+        max_connections=get_pool_config(pool_key).max_connections,
+        connections=len(connections),
+        idle_connections=sum(1 for conn in connections if conn.is_idle()),
+        queued_requests=sum(1 for req in requests if req.is_queued()),
+    )
+
+
+def get_pool_stats() -> Dict[str, PoolStats]:
+    ret: Dict[str, PoolStats] = {}
+
+    for pool_key, client in _http_clients.items():
+        if (stats := _get_client_pool_stats(pool_key, client)) is not None:
+            ret[pool_key] = stats
+
+    return ret
+
+
+def get_single_pool_stats(pool_key: str) -> Optional[PoolStats]:
+    client = _http_clients.get(pool_key)
+    if client is None:
+        return None
+    return _get_client_pool_stats(pool_key, client)
+
+
+def _observe_pools(field: str):
+    def callback(options: CallbackOptions) -> Iterable[Observation]:
+        for pool_key, stats in get_pool_stats().items():
+            yield Observation(getattr(stats, field), {"pool": pool_key})
+
+    return callback
+
+
+for _field in ["connections", "idle_connections", "queued_requests"]:
+    meter.create_observable_gauge(
+        f"http_client.pool.{_field}", callbacks=[_observe_pools(_field)]
+    )
+
+
+_aiohttp_session: aiohttp.ClientSession | None = None
+
+
+def get_aiohttp_session() -> aiohttp.ClientSession:
+    """
+    The session is shared by all the aiohttp calls (DALL-E, DIAL storage, etc.),
+    so that the keep-alive connections are reused across requests.
+    The session is created lazily, since it must be bound to a running event loop.
+    """
+    global _aiohttp_session
+
+    if _aiohttp_session is None or _aiohttp_session.closed:
+        _aiohttp_session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(
+                total=DEFAULT_TIMEOUT.read, connect=DEFAULT_TIMEOUT.connect
+            ),
+            connector=aiohttp.TCPConnector(
+                limit=DEFAULT_CONNECTION_LIMITS.max_connections or 0,
+                resolver=CachingResolver(dns_cache),
+                use_dns_cache=False,
+            ),
+        )
+
+    return _aiohttp_session
+
+
+async def close_http_clients() -> None:
+    for client in _http_clients.values():
+        await client.aclose()
+    _http_clients.clear()
+
+    if _aiohttp_session is not None:
+        await _aiohttp_session.close()
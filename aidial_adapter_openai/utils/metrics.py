@@ -0,0 +1,5 @@
+from opentelemetry import metrics
+
+# The instruments are no-op unless a meter provider is configured
+# by the telemetry initialization (see aidial_sdk.telemetry).
+meter = metrics.get_meter("aidial_adapter_openai")
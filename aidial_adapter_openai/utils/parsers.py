@@ -1,13 +1,17 @@
 import re
 from abc import ABC, abstractmethod
 from json import JSONDecodeError
-from typing import Any, Dict, List, TypedDict
+from typing import Any, Dict, List, TypedDict, cast
 
 from aidial_sdk.exceptions import InvalidRequestError
 from fastapi import Request
 from openai import AsyncAzureOpenAI, AsyncOpenAI, Timeout
 from pydantic import BaseModel
 
+from aidial_adapter_openai.utils.client_cache import (
+    fingerprint,
+    openai_client_cache,
+)
 from aidial_adapter_openai.utils.http_client import get_http_client
 
 
@@ -33,28 +37,52 @@ class AzureOpenAIEndpoint(BaseModel):
     azure_deployment: str
 
     def get_client(self, params: OpenAIParams) -> AsyncAzureOpenAI:
-        return AsyncAzureOpenAI(
-            azure_endpoint=self.azure_endpoint,
-            azure_deployment=self.azure_deployment,
-            api_key=params.get("api_key"),
-            azure_ad_token=params.get("azure_ad_token"),
-            api_version=params.get("api_version"),
-            timeout=params.get("timeout"),
-            max_retries=_MAX_RETRIES,
-            http_client=get_http_client(),
+        key = (
+            "azure",
+            self.azure_endpoint,
+            self.azure_deployment,
+            params.get("api_version"),
+            fingerprint(params.get("api_key")),
+            fingerprint(params.get("azure_ad_token")),
+            repr(params.get("timeout")),
         )
 
+        client = openai_client_cache.get(
+            key,
+            lambda: AsyncAzureOpenAI(
+                azure_endpoint=self.azure_endpoint,
+                azure_deployment=self.azure_deployment,
+                api_key=params.get("api_key"),
+                azure_ad_token=params.get("azure_ad_token"),
+                api_version=params.get("api_version"),
+                timeout=params.get("timeout"),
+                max_retries=_MAX_RETRIES,
+                http_client=get_http_client(self.azure_endpoint),
+            ),
+        )
+        return cast(AsyncAzureOpenAI, client)
+
 
 class OpenAIEndpoint(BaseModel):
     base_url: str
 
     def get_client(self, params: OpenAIParams) -> AsyncOpenAI:
-        return AsyncOpenAI(
-            base_url=self.base_url,
-            api_key=params.get("api_key"),
-            timeout=params.get("timeout"),
-            max_retries=_MAX_RETRIES,
-            http_client=get_http_client(),
+        key = (
+            "openai",
+            self.base_url,
+            fingerprint(params.get("api_key")),
+            repr(params.get("timeout")),
+        )
+
+        return openai_client_cache.get(
+            key,
+            lambda: AsyncOpenAI(
+                base_url=self.base_url,
+                api_key=params.get("api_key"),
+                timeout=params.get("timeout"),
+                max_retries=_MAX_RETRIES,
+                http_client=get_http_client(self.base_url),
+            ),
         )
 
 
@@ -0,0 +1,233 @@
+"""
+Relaying the upstream response stream without re-serializing its chunks.
+
+The upstream SSE events are forwarded as they are and only inspected
+for the usage, the finish reason and the completion tokens.
+The missing fields are sent in a trailing chunk before the end of the stream.
+"""
+
+import os
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+)
+
+import httpx
+from aidial_sdk.exceptions import HTTPException as DialException
+from aidial_sdk.exceptions import RuntimeServerError
+from fastapi.responses import StreamingResponse
+from openai import APIError
+from openai._response import AsyncAPIResponse, AsyncResponseContextManager
+
+from aidial_adapter_openai.env import get_stream_timeouts
+from aidial_adapter_openai.utils.hedging import is_hedging_enabled
+from aidial_adapter_openai.utils.log_config import logger
+from aidial_adapter_openai.utils.parsers import parse_deployment_list
+from aidial_adapter_openai.utils.sse_stream import (
+    END_CHUNK,
+    OPENAI_END_MARKER,
+    InvalidSSEError,
+    SSEDecoder,
+    format_chunk,
+    load_json,
+)
+from aidial_adapter_openai.utils.streaming import (
+    ELIMINATE_EMPTY_CHOICES,
+    StreamTimeoutError,
+    create_stream_error,
+    generate_created,
+    generate_id,
+    timeout_stream,
+    wait_for_stream_start,
+)
+from aidial_adapter_openai.utils.tokenizer import CompletionTokenCounter
+
+PASSTHROUGH_STREAMING_DEPLOYMENTS = parse_deployment_list(
+    os.getenv("PASSTHROUGH_STREAMING_DEPLOYMENTS")
+)
+
+_END_MARKER_BYTES = OPENAI_END_MARKER.encode()
+
+
+def is_passthrough_enabled(deployment: str, request: dict) -> bool:
+    """
+    The pass-through is used only when the chunks don't need to be transformed:
+    the prompt isn't truncated, the empty choices aren't eliminated
+    and the stream isn't hedged.
+    """
+    return (
+        bool(request.get("stream"))
+        and deployment in PASSTHROUGH_STREAMING_DEPLOYMENTS
+        and "max_prompt_tokens" not in request
+        and not ELIMINATE_EMPTY_CHOICES
+        and not is_hedging_enabled(deployment)
+    )
+
+
+async def passthrough_stream(
+    response_manager: AsyncResponseContextManager[AsyncAPIResponse[Any]],
+    *,
+    started_at: float,
+    get_prompt_tokens: Callable[[], Awaitable[int]],
+    create_token_counter: Callable[[], CompletionTokenCounter],
+    deployment: str,
+) -> StreamingResponse:
+    # The upstream errors are raised before the response is started
+    response = await wait_for_stream_start(
+        deployment, response_manager.__aenter__(), started_at
+    )
+
+    async def relay() -> AsyncIterator[bytes]:
+        try:
+            async for data in _relay_events(
+                response.iter_bytes(),
+                started_at=started_at,
+                get_prompt_tokens=get_prompt_tokens,
+                create_token_counter=create_token_counter,
+                deployment=deployment,
+            ):
+                yield data
+        finally:
+            await response_manager.__aexit__(None, None, None)
+
+    return StreamingResponse(relay(), media_type="text/event-stream")
+
+
+async def _relay_events(
+    stream: AsyncIterator[bytes],
+    *,
+    started_at: Optional[float] = None,
+    get_prompt_tokens: Callable[[], Awaitable[int]],
+    create_token_counter: Callable[[], CompletionTokenCounter],
+    deployment: str,
+) -> AsyncIterator[bytes]:
+    decoder = SSEDecoder()
+    # The events aren't kept, the completion tokens are counted
+    # while relaying in case the upstream doesn't report the usage
+    counters: Dict[int, CompletionTokenCounter] = {}
+    first_chunk: Optional[dict] = None
+    found_usage = False
+    found_finish_reason = False
+    found_error = False
+    error = None
+
+    timeouts = get_stream_timeouts(deployment)
+
+    try:
+        async for data in timeout_stream(
+            stream,
+            timeouts.first_chunk_timeout,
+            timeouts.idle_timeout,
+            started_at,
+        ):
+            forwarded: List[bytes] = []
+            is_done = False
+            for event in decoder.feed(data):
+                if event.strip() == _END_MARKER_BYTES:
+                    is_done = True
+                    break
+
+                forwarded.append(b"data: " + event + b"\n\n")
+
+                try:
+                    chunk = load_json(event)
+                except ValueError:
+                    continue
+                if not isinstance(chunk, dict):
+                    continue
+
+                first_chunk = first_chunk or chunk
+                found_usage = found_usage or bool(chunk.get("usage"))
+                found_error = found_error or "error" in chunk
+                for choice in chunk.get("choices") or []:
+                    index = choice["index"]
+                    if (counter := counters.get(index)) is None:
+                        counter = counters[index] = create_token_counter()
+                    delta = choice.get("delta") or {}
+                    counter.add(delta.get("content") or "")
+                    found_finish_reason = found_finish_reason or bool(
+                        choice.get("finish_reason")
+                    )
+
+            if forwarded:
+                yield b"".join(forwarded)
+            if is_done:
+                break
+
+    except (APIError, StreamTimeoutError) as e:
+        error = create_stream_error(e)
+    except InvalidSSEError as e:
+        logger.warning(f"Invalid upstream stream: {e}")
+        error = RuntimeServerError("Invalid chunk format").json_error()
+    except httpx.HTTPError as e:
+        logger.warning(f"Upstream stream failed: {e!r}")
+        error = DialException(
+            status_code=502,
+            type="connection",
+            message="Error communicating with OpenAI",
+            display_message="OpenAI server is not responsive. Please try again later.",
+        ).json_error()
+
+    if error is None and found_error:
+        # The upstream has already reported the error
+        yield END_CHUNK
+        return
+
+    if not (found_usage and found_finish_reason):
+        trailing_chunk = await _create_trailing_chunk(
+            first_chunk or {},
+            counters.values(),
+            set_usage=not found_usage,
+            set_finish_reason=not found_finish_reason and error is None,
+            get_prompt_tokens=get_prompt_tokens,
+            deployment=deployment,
+        )
+        yield format_chunk(trailing_chunk)
+
+    if error is not None:
+        yield format_chunk(error)
+
+    yield END_CHUNK
+
+
+async def _create_trailing_chunk(
+    first_chunk: dict,
+    counters: Iterable[CompletionTokenCounter],
+    *,
+    set_usage: bool,
+    set_finish_reason: bool,
+    get_prompt_tokens: Callable[[], Awaitable[int]],
+    deployment: str,
+) -> dict:
+    choice: dict = {"index": 0, "delta": {}}
+    chunk: dict = {
+        "id": first_chunk.get("id") or generate_id(),
+        "object": "chat.completion.chunk",
+        "created": first_chunk.get("created") or generate_created(),
+        "model": first_chunk.get("model") or deployment,
+        "choices": [choice],
+    }
+
+    if set_finish_reason:
+        if not first_chunk:
+            logger.warning("Received 0 chunks")
+        else:
+            logger.warning("Didn't receive chunk with the finish reason")
+        choice["finish_reason"] = "length"
+
+    if set_usage:
+        completion_tokens = sum(counter.finish() for counter in counters)
+        prompt_tokens = await get_prompt_tokens()
+        chunk["usage"] = {
+            "completion_tokens": completion_tokens,
+            "prompt_tokens": prompt_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    return chunk
@@ -6,9 +6,7 @@ from aidial_sdk.exceptions import InvalidRequestError
 
 
 @functools.lru_cache(maxsize=64)
-def _inspect_signature(
-    func: Callable[..., Coroutine[Any, Any, Any]]
-) -> inspect.Signature:
+def _inspect_signature(func: Callable[..., Any]) -> inspect.Signature:
     return inspect.signature(func)
 
 
@@ -18,8 +16,15 @@ T = TypeVar("T")
 async def call_with_extra_body(
     func: Callable[..., Coroutine[Any, Any, T]], arg: dict
 ) -> T:
+    return await func(**with_extra_body(func, arg))
+
+
+def with_extra_body(func: Callable[..., Any], arg: dict) -> dict:
+    """
+    Moves the arguments which aren't declared by `func` to `extra_body`.
+    """
     if has_kwargs_argument(func):
-        return await func(**arg)
+        return arg
 
     expected_args = set(_inspect_signature(func).parameters.keys())
     actual_args = set(arg.keys())
@@ -37,10 +42,10 @@ async def call_with_extra_body(
         arg["extra_body"][extra_arg] = arg[extra_arg]
         del arg[extra_arg]
 
-    return await func(**arg)
+    return arg
 
 
-def has_kwargs_argument(func: Callable[..., Coroutine[Any, Any, Any]]) -> bool:
+def has_kwargs_argument(func: Callable[..., Any]) -> bool:
     """
     Determines if the given function accepts a variable keyword argument (**kwargs).
     """
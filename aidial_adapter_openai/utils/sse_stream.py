@@ -1,58 +1,176 @@
 import json
-from typing import Any, AsyncIterator, Mapping
+from typing import Any, AsyncIterator, List, Mapping, Optional
 
+import orjson
 from aidial_sdk.exceptions import runtime_server_error
+from fastapi.responses import StreamingResponse
 
 DATA_PREFIX = "data: "
 OPENAI_END_MARKER = "[DONE]"
 
+_DATA_PREFIX_BYTES = DATA_PREFIX.encode()
+_EVENT_END_BYTES = b"\n\n"
 
-def format_chunk(data: str | Mapping[str, Any]) -> str:
+
+def dump_json(data: Any) -> bytes:
+    """
+    Compact JSON serialization straight to UTF-8 bytes.
+    Falls back to the standard library for the values orjson doesn't support
+    (e.g. integers beyond 64 bits).
+    """
+    try:
+        return orjson.dumps(data)
+    except TypeError:
+        return json.dumps(data, separators=(",", ":")).encode()
+
+
+def format_chunk(data: str | Mapping[str, Any]) -> bytes:
     if isinstance(data, str):
-        return DATA_PREFIX + data.strip() + "\n\n"
+        payload = data.strip().encode()
     else:
-        return DATA_PREFIX + json.dumps(data, separators=(",", ":")) + "\n\n"
+        payload = dump_json(data)
+    return _DATA_PREFIX_BYTES + payload + _EVENT_END_BYTES
 
 
 END_CHUNK = format_chunk(OPENAI_END_MARKER)
 
 
+def load_json(data: bytes) -> Any:
+    return orjson.loads(data)
+
+
+class InvalidSSEError(Exception):
+    pass
+
+
+class SSEDecoder:
+    """
+    Incremental decoder of server-sent events from a byte stream
+    split at arbitrary boundaries.
+    Returns the data of each complete event with the lines of
+    a multi-line data joined by a newline.
+    Comments and the fields other than data are skipped.
+    """
+
+    _buffer: bytes
+    _data: List[bytes]
+    _is_first_line: bool
+
+    def __init__(self) -> None:
+        self._buffer = b""
+        self._data = []
+        self._is_first_line = True
+
+    def feed(self, data: bytes) -> List[bytes]:
+        buffer = self._buffer + data if self._buffer else data
+        events: List[bytes] = []
+
+        start = 0
+        while (end := buffer.find(b"\n", start)) != -1:
+            event = self._process_line(buffer[start:end])
+            if event is not None:
+                events.append(event)
+            start = end + 1
+
+        self._buffer = buffer[start:]
+        return events
+
+    def close(self) -> List[bytes]:
+        """
+        Dispatches the last event even if the stream ended
+        without the blank line terminating it.
+        """
+        events: List[bytes] = []
+        for line in [self._buffer, b""]:
+            event = self._process_line(line)
+            if event is not None:
+                events.append(event)
+        self._buffer = b""
+        return events
+
+    def _process_line(self, line: bytes) -> Optional[bytes]:
+        if line.endswith(b"\r"):
+            line = line[:-1]
+
+        if self._is_first_line:
+            self._is_first_line = False
+            line = line.removeprefix(_UTF8_BOM)
+
+        if not line:
+            if not self._data:
+                return None
+            event = (
+                self._data[0]
+                if len(self._data) == 1
+                else b"\n".join(self._data)
+            )
+            self._data = []
+            return event
+
+        if line.startswith(b":"):
+            return None
+
+        field, _, value = line.partition(b":")
+        if field == b"data":
+            self._data.append(value.removeprefix(b" "))
+        elif field not in _SKIPPED_FIELDS:
+            raise InvalidSSEError(f"Unexpected SSE field: {field!r}")
+        return None
+
+
+_UTF8_BOM = b"\xef\xbb\xbf"
+_SKIPPED_FIELDS = (b"event", b"id", b"retry")
+_END_MARKER_BYTES = OPENAI_END_MARKER.encode()
+
+
 async def parse_openai_sse_stream(
     stream: AsyncIterator[bytes],
 ) -> AsyncIterator[dict]:
-    async for line in stream:
-        try:
-            payload = line.decode("utf-8-sig").lstrip()
-        except Exception:
-            yield runtime_server_error(
-                "Can't decode chunk to a string"
-            ).json_error()
-            return
+    decoder = SSEDecoder()
 
-        if payload.strip() == "":
-            continue
+    async def events() -> AsyncIterator[bytes]:
+        async for data in stream:
+            for event in decoder.feed(data):
+                yield event
+        for event in decoder.close():
+            yield event
 
-        if not payload.startswith(DATA_PREFIX):
-            yield runtime_server_error("Invalid chunk format").json_error()
-            return
+    try:
+        async for event in events():
+            if event.strip() == _END_MARKER_BYTES:
+                break
 
-        payload = payload[len(DATA_PREFIX) :]
+            try:
+                chunk = load_json(event)
+            except ValueError:
+                yield runtime_server_error(
+                    "Can't parse chunk to JSON"
+                ).json_error()
+                return
 
-        if payload.strip() == OPENAI_END_MARKER:
-            break
-
-        try:
-            chunk = json.loads(payload)
-        except json.JSONDecodeError:
-            yield runtime_server_error("Can't parse chunk to JSON").json_error()
-            return
-
-        yield chunk
+            yield chunk
+    except InvalidSSEError:
+        yield runtime_server_error("Invalid chunk format").json_error()
 
 
 async def to_openai_sse_stream(
     stream: AsyncIterator[dict],
-) -> AsyncIterator[str]:
+) -> AsyncIterator[bytes]:
     async for chunk in stream:
         yield format_chunk(chunk)
     yield END_CHUNK
+
+
+class SSEStreamingResponse(StreamingResponse):
+    """
+    Streams the chunks as pre-framed SSE events.
+    The events are sent to the ASGI channel as bytes,
+    so they aren't encoded once again by the response.
+    """
+
+    def __init__(self, stream: AsyncIterator[dict], **kwargs) -> None:
+        super().__init__(
+            to_openai_sse_stream(stream),
+            media_type="text/event-stream",
+            **kwargs,
+        )
@@ -1,21 +1,38 @@
+import asyncio
 import logging
-from time import time
-from typing import Any, AsyncIterator, Callable, Iterable, Optional, TypeVar
+from time import monotonic, time
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Optional,
+    TypeVar,
+)
 from uuid import uuid4
 
 from aidial_sdk.exceptions import HTTPException as DialException
-from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.responses import JSONResponse, Response
 from openai import APIError, APIStatusError
 from openai.types.chat.chat_completion_chunk import ChatCompletionChunk
 from pydantic import BaseModel
 
-from aidial_adapter_openai.env import get_eliminate_empty_choices
+from aidial_adapter_openai.env import (
+    ZERO_LAG_STREAMING_DEPLOYMENTS,
+    get_eliminate_empty_choices,
+    get_stream_timeouts,
+)
 from aidial_adapter_openai.utils.log_config import logger
 from aidial_adapter_openai.utils.merge_chunks import merge_chunks
-from aidial_adapter_openai.utils.sse_stream import to_openai_sse_stream
+from aidial_adapter_openai.utils.sse_stream import SSEStreamingResponse
+from aidial_adapter_openai.utils.tokenizer import CompletionTokenCounter
 
 ELIMINATE_EMPTY_CHOICES = get_eliminate_empty_choices()
 
+T = TypeVar("T")
+V = TypeVar("V")
+
 
 def generate_id() -> str:
     return "chatcmpl-" + str(uuid4())
@@ -51,14 +68,121 @@ def build_chunk(
     }
 
 
+class StreamTimeoutError(Exception):
+    pass
+
+
+def _create_timeout_exception(message: str) -> DialException:
+    return DialException(
+        status_code=504,
+        type="timeout",
+        message=f"Upstream stream timed out. {message}",
+        display_message="Request timed out. Please try again later.",
+    )
+
+
+async def wait_for_stream_start(
+    deployment: str, start: Awaitable[T], started_at: float
+) -> T:
+    """
+    Awaits the upstream stream to start within the first chunk timeout
+    counted from `started_at`, so that the timeout covers the time
+    to the response headers and the first bytes too.
+    """
+    first_chunk_timeout = get_stream_timeouts(deployment).first_chunk_timeout
+    if first_chunk_timeout is None:
+        return await start
+
+    timeout = max(0.0, first_chunk_timeout - (monotonic() - started_at))
+    try:
+        return await asyncio.wait_for(start, timeout)
+    except asyncio.TimeoutError:
+        message = (
+            f"The first chunk wasn't received in {first_chunk_timeout} seconds."
+        )
+        logger.warning(f"Upstream stream timed out: {message}")
+        raise _create_timeout_exception(message)
+
+
+async def timeout_stream(
+    stream: AsyncIterator[T],
+    first_chunk_timeout: Optional[float],
+    idle_timeout: Optional[float],
+    started_at: Optional[float] = None,
+) -> AsyncIterator[T]:
+    """
+    Raises StreamTimeoutError when the first item or any subsequent item
+    doesn't arrive in time.
+    The first chunk timeout is counted from `started_at` when it's given.
+    The pending read is cancelled, which closes the upstream connection.
+    """
+    if first_chunk_timeout is None and idle_timeout is None:
+        async for item in stream:
+            yield item
+        return
+
+    iterator = aiter(stream)
+    is_first = True
+
+    while True:
+        timeout = first_chunk_timeout if is_first else idle_timeout
+        wait_timeout = timeout
+        if is_first and timeout is not None and started_at is not None:
+            wait_timeout = max(0.0, timeout - (monotonic() - started_at))
+        try:
+            item = await asyncio.wait_for(anext(iterator), wait_timeout)
+        except StopAsyncIteration:
+            return
+        except asyncio.TimeoutError:
+            chunk_name = "first" if is_first else "next"
+            raise StreamTimeoutError(
+                f"The {chunk_name} chunk wasn't received in {timeout} seconds."
+            )
+
+        yield item
+        is_first = False
+
+
+def create_stream_error(e: APIError | StreamTimeoutError) -> dict:
+    """
+    The error chunk terminating a stream interrupted by the upstream
+    """
+    if isinstance(e, StreamTimeoutError):
+        logger.warning(f"Upstream stream timed out: {e}")
+        return _create_timeout_exception(str(e)).json_error()
+
+    status_code = e.status_code if isinstance(e, APIStatusError) else 500
+    return DialException(
+        status_code=status_code,
+        message=e.message,
+        type=e.type,
+        param=e.param,
+        code=e.code,
+    ).json_error()
+
+
 async def generate_stream(
     *,
-    get_prompt_tokens: Callable[[], int],
-    tokenize: Callable[[str], int],
+    get_prompt_tokens: Callable[[], Awaitable[int]],
+    create_token_counter: Callable[[], CompletionTokenCounter],
     deployment: str,
     discarded_messages: Optional[list[int]],
     stream: AsyncIterator[dict],
+    merge_usage_chunk: bool = False,
+    started_at: Optional[float] = None,
 ) -> AsyncIterator[dict]:
+    """
+    When `merge_usage_chunk` is set, the usage-only chunk reported by the upstream
+    is merged into the last chunk, since the client didn't request it.
+
+    `started_at` is the time the upstream request was sent,
+    the first chunk timeout is counted from it.
+
+    By default, the latest chunk is withheld until the next one arrives,
+    so that the usage, finish reason and statistics are patched into the last chunk.
+    In the zero-lag mode each chunk is forwarded as soon as it arrives
+    and these fields are sent in a separate trailing chunk.
+    """
 
     noop_chunk = build_chunk(
         id=generate_id(),
@@ -69,10 +193,12 @@ async def generate_stream(
         finish_reason=None,
     )
 
-    def set_usage(chunk: dict | None, completions: Iterable[str]) -> dict:
+    async def set_usage(
+        chunk: dict | None, counters: Iterable[CompletionTokenCounter]
+    ) -> dict:
         chunk = chunk or noop_chunk
-        completion_tokens = sum(map(tokenize, completions))
-        prompt_tokens = get_prompt_tokens()
+        completion_tokens = sum(counter.finish() for counter in counters)
+        prompt_tokens = await get_prompt_tokens()
         chunk["usage"] = {
             "completion_tokens": completion_tokens,
             "prompt_tokens": prompt_tokens,
@@ -91,17 +217,36 @@ async def generate_stream(
         chunk["statistics"] = {"discarded_messages": indices}
         return chunk
 
+    def forward_ids(chunk: dict) -> None:
+        # The trailing chunk belongs to the same completion as the forwarded ones
+        for key in ["id", "created", "model"]:
+            if key in chunk:
+                noop_chunk[key] = chunk[key]
+
+    zero_lag = deployment in ZERO_LAG_STREAMING_DEPLOYMENTS
+
     n_chunks = 0
+    # In the zero-lag mode, the chunk which is sent after the upstream stream ends
     last_chunk = None
     buffer_chunk = None
 
-    completions: dict[int, str] = {}
+    counters: dict[int, CompletionTokenCounter] = {}
+    # The upstream is expected to report the usage when `merge_usage_chunk` is set,
+    # so the deltas are kept and tokenized only if the usage doesn't arrive
+    deltas: dict[int, list[str]] = {}
     found_finish_reason = False
     found_usage = False
     error = None
 
+    timeouts = get_stream_timeouts(deployment)
+
     try:
-        async for chunk in stream:
+        async for chunk in timeout_stream(
+            stream,
+            timeouts.first_chunk_timeout,
+            timeouts.idle_timeout,
+            started_at,
+        ):
             n_chunks += 1
 
             if buffer_chunk is not None:
@@ -114,7 +259,12 @@ async def generate_stream(
                 index = choice["index"]
                 content = (choice.get("delta") or {}).get("content") or ""
 
-                completions[index] = completions.get(index, "") + content
+                if merge_usage_chunk:
+                    deltas.setdefault(index, []).append(content)
+                else:
+                    if (counter := counters.get(index)) is None:
+                        counter = counters[index] = create_token_counter()
+                    counter.add(content)
                 found_finish_reason |= bool(choice.get("finish_reason"))
 
             found_usage |= bool(chunk.get("usage"))
@@ -123,31 +273,45 @@ async def generate_stream(
             # when content filtering is enabled for a corresponding deployment.
             # The safety rating of the request is reported in this first chunk.
             # Here we withhold such a chunk and merge it later with a follow-up chunk.
-            if len(choices) == 0 and ELIMINATE_EMPTY_CHOICES:
+            if (
+                len(choices) == 0
+                and merge_usage_chunk
+                and chunk.get("usage")
+                and (last_chunk is not None or zero_lag)
+            ):
+                last_chunk = (
+                    chunk
+                    if last_chunk is None
+                    else merge_chunks(last_chunk, chunk)
+                )
+            elif len(choices) == 0 and ELIMINATE_EMPTY_CHOICES:
                 buffer_chunk = chunk
+            elif zero_lag:
+                forward_ids(chunk)
+                yield chunk
             else:
                 if last_chunk is not None:
                     yield last_chunk
                 last_chunk = chunk
 
-    except APIError as e:
-        status_code = e.status_code if isinstance(e, APIStatusError) else 500
-        error = DialException(
-            status_code=status_code,
-            message=e.message,
-            type=e.type,
-            param=e.param,
-            code=e.code,
-        ).json_error()
+    except (APIError, StreamTimeoutError) as e:
+        error = create_stream_error(e)
 
     if last_chunk is not None and buffer_chunk is not None:
         last_chunk = merge_chunks(buffer_chunk, last_chunk)
+    elif zero_lag and buffer_chunk is not None:
+        last_chunk = buffer_chunk
 
     if discarded_messages is not None:
         last_chunk = set_discarded_messages(last_chunk, discarded_messages)
 
-    if not found_usage and (not error or completions):
-        last_chunk = set_usage(last_chunk, completions.values())
+    if not found_usage:
+        for index, texts in deltas.items():
+            counter = counters[index] = create_token_counter()
+            counter.add("".join(texts))
+
+    if not found_usage and (not error or counters):
+        last_chunk = await set_usage(last_chunk, counters.values())
 
     if not error:
         if n_chunks == 0:
@@ -158,8 +322,12 @@ async def generate_stream(
         if not found_finish_reason:
             last_chunk = set_finish_reason(last_chunk, "length")
 
-        if not found_usage:
-            last_chunk = set_usage(last_chunk, completions.values())
+    # The client didn't request the usage-only chunk with empty choices,
+    # so the trailing chunk is always sent with a choice
+    if zero_lag and last_chunk:
+        last_chunk["choices"] = last_chunk.get("choices") or [
+            {"index": 0, "delta": {}}
+        ]
 
     if last_chunk:
         yield last_chunk
@@ -213,10 +381,7 @@ def create_response_from_chunk(
         if exc is not None:
             yield exc.json_error()
 
-    return StreamingResponse(
-        to_openai_sse_stream(generator()),
-        media_type="text/event-stream",
-    )
+    return SSEStreamingResponse(generator())
 
 
 def block_response_to_streaming_chunk(response: dict) -> dict:
@@ -240,10 +405,7 @@ def create_server_response(
         return stream()
 
     def stream_to_response(stream: AsyncIterator[dict]) -> Response:
-        return StreamingResponse(
-            to_openai_sse_stream(stream),
-            media_type="text/event-stream",
-        )
+        return SSEStreamingResponse(stream)
 
     def block_to_response(block: dict) -> Response:
         if emulate_stream:
@@ -263,10 +425,6 @@ def create_server_response(
     return response
 
 
-T = TypeVar("T")
-V = TypeVar("V")
-
-
 async def prepend_to_stream(
     value: T, iterator: AsyncIterator[T]
 ) -> AsyncIterator[T]:
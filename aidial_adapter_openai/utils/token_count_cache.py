@@ -0,0 +1,120 @@
+"""
+Content-addressed cache of message token counts.
+
+The chat clients send the whole conversation history in every request,
+so the tokens of the earlier messages are taken from the cache
+and only the new messages are tokenized.
+"""
+
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+from opentelemetry.metrics import CallbackOptions, Observation
+
+from aidial_adapter_openai.utils.metrics import meter
+
+TOKEN_COUNT_CACHE_MAX_BYTES = int(
+    os.getenv("TOKEN_COUNT_CACHE_MAX_BYTES", str(16 * 1024 * 1024))
+)
+
+# The messages shorter than this number of characters are cheaper
+# to tokenize than to look up in the cache
+_MIN_CACHED_SIZE = 256
+
+# The memory taken by an entry of OrderedDict besides its key and value
+_ENTRY_OVERHEAD = 100
+
+_hits_counter = meter.create_counter(
+    "token_count_cache.hits", description="Number of token count cache hits"
+)
+_misses_counter = meter.create_counter(
+    "token_count_cache.misses",
+    description="Number of token count cache misses",
+)
+
+
+class TokenCountCache:
+    """
+    LRU cache of the number of tokens in the texts of a message.
+    The size of the cache is limited by the memory taken by its entries.
+    The cache is thread-safe, since the tokenization may run
+    on the tokenizer thread pool.
+    """
+
+    max_bytes: int
+    size_bytes: int
+
+    _entries: "OrderedDict[bytes, int]"
+    _lock: threading.Lock
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_key(self, encoding: str, texts: List[str]) -> Optional[bytes]:
+        """
+        Returns None when the texts aren't worth caching.
+        """
+        if self.max_bytes <= 0 or sum(map(len, texts)) < _MIN_CACHED_SIZE:
+            return None
+
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(encoding.encode())
+        for text in texts:
+            data = text.encode("utf-8", "surrogatepass")
+            digest.update(len(data).to_bytes(8, "little"))
+            digest.update(data)
+        return digest.digest()
+
+    def get(self, key: bytes) -> Optional[int]:
+        with self._lock:
+            tokens = self._entries.get(key)
+            if tokens is not None:
+                self._entries.move_to_end(key)
+
+        counter = _misses_counter if tokens is None else _hits_counter
+        counter.add(1)
+        return tokens
+
+    def put(self, key: bytes, tokens: int) -> None:
+        entry_size = _entry_size(key, tokens)
+        with self._lock:
+            if (old_tokens := self._entries.pop(key, None)) is not None:
+                self.size_bytes -= _entry_size(key, old_tokens)
+
+            self._entries[key] = tokens
+            self.size_bytes += entry_size
+
+            while self.size_bytes > self.max_bytes and self._entries:
+                old_key, old_tokens = self._entries.popitem(last=False)
+                self.size_bytes -= _entry_size(old_key, old_tokens)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+
+def _entry_size(key: bytes, tokens: int) -> int:
+    return sys.getsizeof(key) + sys.getsizeof(tokens) + _ENTRY_OVERHEAD
+
+
+token_count_cache = TokenCountCache(max_bytes=TOKEN_COUNT_CACHE_MAX_BYTES)
+
+
+def _observe_size(options: CallbackOptions) -> Iterable[Observation]:
+    yield Observation(token_count_cache.size_bytes)
+
+
+meter.create_observable_gauge(
+    "token_count_cache.size", unit="By", callbacks=[_observe_size]
+)
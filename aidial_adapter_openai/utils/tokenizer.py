@@ -3,17 +3,80 @@ Implemented based on the official recipe: https://cookbook.openai.com/examples/h
 """
 
 from abc import abstractmethod
-from typing import Any, Callable, Generic, List, TypeVar
+from functools import cached_property
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+)
 
+import regex
 from aidial_sdk.exceptions import InternalServerError
 from tiktoken import Encoding, encoding_for_model
 
 from aidial_adapter_openai.utils.image_tokenizer import tokenize_image_by_size
 from aidial_adapter_openai.utils.multi_modal_message import MultiModalMessage
+from aidial_adapter_openai.utils.token_count_cache import token_count_cache
+from aidial_adapter_openai.utils.tokenizer_pool import (
+    get_batcher,
+    is_batching_enabled,
+    run_tokenization,
+)
 
 MessageType = TypeVar("MessageType")
 
 
+class CompletionTokenCounter:
+    """
+    Counts the tokens of a text which is received in parts.
+
+    tiktoken splits a text into pieces with a regular expression
+    and tokenizes each piece independently.
+    So the pieces which can't be affected by the following parts
+    are tokenized right away and only the tail of the text is kept.
+    The last two pieces and the whitespace pieces preceding them
+    may be merged with the next part, e.g. " " followed by "\n" or "it'" followed by "s".
+    """
+
+    tokens: int
+    pending: str
+
+    def __init__(
+        self, tokenize: Callable[[str], int], pattern: "regex.Pattern[str]"
+    ) -> None:
+        self.tokenize = tokenize
+        self.pattern = pattern
+        self.tokens = 0
+        self.pending = ""
+
+    def add(self, text: str) -> None:
+        if not text:
+            return
+
+        self.pending += text
+        pieces = self.pattern.findall(self.pending)
+
+        stable = len(pieces) - 2
+        while stable > 0 and pieces[stable - 1].isspace():
+            stable -= 1
+
+        if stable > 0:
+            self.tokens += self.tokenize("".join(pieces[:stable]))
+            self.pending = "".join(pieces[stable:])
+
+    def finish(self) -> int:
+        if self.pending:
+            self.tokens += self.tokenize(self.pending)
+            self.pending = ""
+        return self.tokens
+
+
 class BaseTokenizer(Generic[MessageType]):
     model: str
     encoding: Encoding
@@ -33,6 +96,25 @@ class BaseTokenizer(Generic[MessageType]):
     def calculate_text_tokens(self, text: str) -> int:
         return len(self.encoding.encode(text))
 
+    async def calculate_text_tokens_async(self, text: str) -> int:
+        if is_batching_enabled():
+            [tokens] = await get_batcher(self.encoding).count([text])
+            return tokens
+
+        return await run_tokenization(
+            len(text), lambda: self.calculate_text_tokens(text)
+        )
+
+    @cached_property
+    def pattern(self) -> "regex.Pattern[str]":
+        """
+        The pattern tiktoken splits a text with before tokenization
+        """
+        return regex.compile(self.encoding._pat_str)
+
+    def create_completion_token_counter(self) -> CompletionTokenCounter:
+        return CompletionTokenCounter(self.calculate_text_tokens, self.pattern)
+
     @property
     def tokens_per_message(self) -> int:
         """
@@ -63,21 +145,170 @@ class BaseTokenizer(Generic[MessageType]):
             messages_tokens=sum(map(self.calculate_message_tokens, messages))
         )
 
+    async def calculate_prompt_tokens_async(
+        self, messages: List[MessageType]
+    ) -> int:
+        if is_batching_enabled():
+            tokens = 0
+            uncached: List[Tuple[Optional[bytes], List[str]]] = []
+            for message in messages:
+                message_tokens, texts = self.get_message_texts(message)
+                tokens += message_tokens
+
+                key = token_count_cache.get_key(self.encoding.name, texts)
+                if key is not None and (
+                    (cached := token_count_cache.get(key)) is not None
+                ):
+                    tokens += cached
+                else:
+                    uncached.append((key, texts))
+
+            text_tokens = iter(
+                await get_batcher(self.encoding).count(
+                    [text for _, texts in uncached for text in texts]
+                )
+            )
+            for key, texts in uncached:
+                texts_tokens = sum(next(text_tokens) for _ in texts)
+                if key is not None:
+                    token_count_cache.put(key, texts_tokens)
+                tokens += texts_tokens
+
+            return self.calculate_request_prompt_tokens(messages_tokens=tokens)
+
+        return await run_tokenization(
+            self.calculate_prompt_size(messages),
+            lambda: self.calculate_prompt_tokens(messages),
+        )
+
+    def calculate_prompt_size(self, messages: List[MessageType]) -> int:
+        """
+        The number of characters in the messages which are subject to tokenization
+        """
+        return sum(map(self.calculate_message_size, messages))
+
+    def calculate_prompt_tokens_upper_bound(
+        self, messages: List[MessageType]
+    ) -> int:
+        """
+        Every token of a byte-level BPE encoding covers at least one byte of the text,
+        so the number of UTF-8 bytes in the texts bounds the number of their tokens.
+        The bound is computed without tokenization.
+        """
+        tokens = self.TOKENS_PER_REQUEST
+        for message in messages:
+            message_tokens, texts = self.get_message_texts(message)
+            tokens += message_tokens + sum(map(_utf8_length, texts))
+        return tokens
+
+    def calculate_tools_tokens(self, request: dict) -> int:
+        """
+        Tokens of the tool and function definitions in the request.
+        Implemented based on the official recipe: https://cookbook.openai.com/examples/how_to_count_tokens_with_tiktoken
+        """
+        functions = _get_request_functions(request)
+        if not functions:
+            return 0
+
+        func_init = 7 if self.encoding.name == "o200k_base" else 10
+        prop_init, prop_key, enum_init, enum_item, func_end = 3, 3, -3, 3, 12
+
+        tokens = 0
+        for function in functions:
+            tokens += func_init
+            name = function.get("name") or ""
+            description = _strip_period(function.get("description") or "")
+            tokens += self.calculate_text_tokens(f"{name}:{description}")
+
+            parameters = function.get("parameters") or {}
+            properties: dict = parameters.get("properties") or {}
+            if properties:
+                tokens += prop_init
+                for key, prop in properties.items():
+                    tokens += prop_key
+                    if "enum" in prop:
+                        tokens += enum_init
+                        for item in prop["enum"]:
+                            tokens += enum_item
+                            tokens += self.calculate_text_tokens(str(item))
+
+                    prop_type = prop.get("type") or ""
+                    prop_description = _strip_period(
+                        prop.get("description") or ""
+                    )
+                    tokens += self.calculate_text_tokens(
+                        f"{key}:{prop_type}:{prop_description}"
+                    )
+
+        return tokens + func_end
+
     def available_message_tokens(self, max_prompt_tokens: int):
         return max_prompt_tokens - self.TOKENS_PER_REQUEST
 
     @abstractmethod
+    def get_message_texts(self, message: MessageType) -> Tuple[int, List[str]]:
+        """
+        Returns the number of message tokens which don't depend on the texts
+        of the message and the texts which are subject to tokenization
+        """
+
     def calculate_message_tokens(self, message: MessageType) -> int:
-        pass
+        tokens, texts = self.get_message_texts(message)
+        return tokens + self._calculate_texts_tokens(texts)
+
+    def _calculate_texts_tokens(self, texts: List[str]) -> int:
+        key = token_count_cache.get_key(self.encoding.name, texts)
+        if key is None:
+            return sum(map(self.calculate_text_tokens, texts))
+
+        tokens = token_count_cache.get(key)
+        if tokens is None:
+            tokens = sum(map(self.calculate_text_tokens, texts))
+            token_count_cache.put(key, tokens)
+        return tokens
+
+    def calculate_message_size(self, message: MessageType) -> int:
+        _, texts = self.get_message_texts(message)
+        return sum(map(len, texts))
+
+
+def _utf8_length(text: str) -> int:
+    # isascii() is O(1) for the strings which are stored as ASCII
+    if text.isascii():
+        return len(text)
+    return len(text.encode("utf-8", "surrogatepass"))
+
+
+def _function_call_texts(function_call: Any) -> List[str]:
+    if not isinstance(function_call, dict):
+        return []
+    return [
+        value
+        for key in ["name", "arguments"]
+        if isinstance(value := function_call.get(key), str)
+    ]
+
+
+def _strip_period(text: str) -> str:
+    return text[:-1] if text.endswith(".") else text
+
+
+def _get_request_functions(request: dict) -> List[dict]:
+    functions = [
+        tool["function"]
+        for tool in request.get("tools") or []
+        if tool.get("type") == "function" and tool.get("function")
+    ]
+    return functions + list(request.get("functions") or [])
 
 
 def _process_raw_message(
     raw_message: dict,
     tokens_per_name: int,
-    calculate_text_tokens: Callable[[str], int],
     handle_custom_content_part: Callable[[Any], None],
-) -> int:
+) -> Tuple[int, List[str]]:
     tokens = 0
+    texts: List[str] = []
     for key, value in raw_message.items():
         if key == "name":
             tokens += tokens_per_name
@@ -86,12 +317,12 @@ def _process_raw_message(
             if isinstance(value, list):
                 for content_part in value:
                     if content_part["type"] == "text":
-                        tokens += calculate_text_tokens(content_part["text"])
+                        texts.append(content_part["text"])
                     else:
                         handle_custom_content_part(content_part)
 
             elif isinstance(value, str):
-                tokens += calculate_text_tokens(value)
+                texts.append(value)
             elif value is None:
                 pass
             else:
@@ -99,14 +330,25 @@ def _process_raw_message(
                     f"Unexpected type of content in message: {value!r}"
                 )
 
+        elif key == "tool_call_id":
+            if isinstance(value, str):
+                texts.append(value)
+
+        elif key == "tool_calls":
+            for tool_call in value or []:
+                texts.extend(_function_call_texts(tool_call.get("function")))
+
+        elif key == "function_call":
+            texts.extend(_function_call_texts(value))
+
         elif key == "role":
             if isinstance(value, str):
-                tokens += calculate_text_tokens(value)
+                texts.append(value)
             else:
                 raise InternalServerError(
                     f"Unexpected type of 'role' field in message: {value!r}"
                 )
-    return tokens
+    return tokens, texts
 
 
 class PlainTextTokenizer(BaseTokenizer[dict]):
@@ -121,26 +363,25 @@ class PlainTextTokenizer(BaseTokenizer[dict]):
             f"Use MultiModalTokenizer for messages with images"
         )
 
-    def calculate_message_tokens(self, message: dict) -> int:
-        return self.tokens_per_message + _process_raw_message(
+    def get_message_texts(self, message: dict) -> Tuple[int, List[str]]:
+        tokens, texts = _process_raw_message(
             raw_message=message,
             tokens_per_name=self.tokens_per_name,
-            calculate_text_tokens=self.calculate_text_tokens,
             handle_custom_content_part=self._handle_custom_content_part,
         )
+        return self.tokens_per_message + tokens, texts
 
 
 class MultiModalTokenizer(BaseTokenizer[MultiModalMessage]):
-    def calculate_message_tokens(self, message: MultiModalMessage) -> int:
-        tokens = self.tokens_per_message
-        raw_message = message.raw_message
-
-        tokens += _process_raw_message(
-            raw_message=raw_message,
+    def get_message_texts(
+        self, message: MultiModalMessage
+    ) -> Tuple[int, List[str]]:
+        tokens, texts = _process_raw_message(
+            raw_message=message.raw_message,
             tokens_per_name=self.tokens_per_name,
-            calculate_text_tokens=self.calculate_text_tokens,
             handle_custom_content_part=lambda content_part: None,
         )
+        tokens += self.tokens_per_message
 
         # Processing image parts of message
         for metadata in message.image_metadatas:
@@ -149,4 +390,21 @@ class MultiModalTokenizer(BaseTokenizer[MultiModalMessage]):
                 height=metadata.height,
                 detail=metadata.detail,
             )
-        return tokens
+        return tokens, texts
+
+
+TokenizerType = TypeVar("TokenizerType", bound=BaseTokenizer)
+
+_tokenizers: Dict[Tuple[type, str], BaseTokenizer] = {}
+
+
+def get_tokenizer(cls: Type[TokenizerType], model: str) -> TokenizerType:
+    """
+    Returns a tokenizer shared by all the requests to the model.
+    The model is expected to be already resolved via MODEL_ALIASES.
+    """
+    key = (cls, model)
+    tokenizer = _tokenizers.get(key)
+    if tokenizer is None:
+        tokenizer = _tokenizers[key] = cls(model)
+    return tokenizer  # type: ignore
@@ -0,0 +1,207 @@
+"""
+Thread pool for tokenization of large texts.
+
+tiktoken releases the GIL while encoding, so large texts are tokenized
+on dedicated threads, which keeps the event loop responsive
+for the concurrent streams.
+
+Optionally, the texts from concurrent requests are collected
+over a short window and tokenized on the pool in batches.
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    TypeVar,
+)
+
+from opentelemetry.metrics import CallbackOptions, Observation
+from tiktoken import Encoding
+
+from aidial_adapter_openai.utils.metrics import meter
+
+TOKENIZER_THREADS = int(os.getenv("TOKENIZER_THREADS", "2"))
+# The number of characters starting from which the tokenization
+# is moved off the event loop
+TOKENIZER_OFFLOAD_THRESHOLD = int(
+    os.getenv("TOKENIZER_OFFLOAD_THRESHOLD", "10000")
+)
+# The number of seconds the texts to tokenize are collected for
+# before being tokenized in a single batch. The batching is disabled when 0.
+TOKENIZER_BATCH_WINDOW = float(os.getenv("TOKENIZER_BATCH_WINDOW", "0"))
+TOKENIZER_BATCH_MAX_SIZE = int(os.getenv("TOKENIZER_BATCH_MAX_SIZE", "256"))
+
+_executor = ThreadPoolExecutor(
+    max_workers=TOKENIZER_THREADS, thread_name_prefix="tokenizer"
+)
+
+_wait_time = meter.create_histogram(
+    "tokenizer.pool.wait_time",
+    unit="s",
+    description="Time a tokenization job spends in the queue of the pool",
+)
+_run_time = meter.create_histogram(
+    "tokenizer.pool.run_time",
+    unit="s",
+    description="Time spent on a tokenization job in the pool",
+)
+
+_batch_size = meter.create_histogram(
+    "tokenizer.batch.size",
+    description="Number of texts tokenized in a single batch",
+)
+
+
+def _observe_queue(options: CallbackOptions) -> Iterable[Observation]:
+    yield Observation(get_queued_jobs())
+
+
+meter.create_observable_gauge(
+    "tokenizer.pool.queued_jobs", callbacks=[_observe_queue]
+)
+
+_T = TypeVar("_T")
+
+
+def get_queued_jobs() -> int:
+    """
+    The number of tokenization jobs submitted to the pool and not yet started
+    """
+    return _executor._work_queue.qsize()
+
+
+async def run_tokenization(size: int, func: Callable[[], _T]) -> _T:
+    """
+    Runs the tokenization job on the event loop when the input `size`
+    is small and on the tokenizer thread pool otherwise.
+    """
+    if size < TOKENIZER_OFFLOAD_THRESHOLD:
+        return func()
+
+    submitted_at = time.perf_counter()
+
+    def job() -> _T:
+        started_at = time.perf_counter()
+        _wait_time.record(started_at - submitted_at)
+        try:
+            return func()
+        finally:
+            _run_time.record(time.perf_counter() - started_at)
+
+    return await asyncio.get_running_loop().run_in_executor(_executor, job)
+
+
+def is_batching_enabled() -> bool:
+    return TOKENIZER_BATCH_WINDOW > 0
+
+
+class _Job(NamedTuple):
+    texts: List[str]
+    future: "asyncio.Future[List[int]]"
+
+
+class TokenizationBatcher:
+    """
+    Collects the texts to tokenize from concurrent requests
+    and counts their tokens in a single call to the tokenizer pool.
+    """
+
+    encoding: Encoding
+    jobs: List[_Job]
+    size: int
+    flush_handle: Optional[asyncio.TimerHandle]
+    flushes: Set["asyncio.Task[None]"]
+
+    def __init__(self, encoding: Encoding) -> None:
+        self.encoding = encoding
+        self.jobs = []
+        self.size = 0
+        self.flush_handle = None
+        self.flushes = set()
+
+    async def count(self, texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.jobs.append(_Job(texts, future))
+        self.size += len(texts)
+
+        if self.size >= TOKENIZER_BATCH_MAX_SIZE:
+            self._flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(
+                TOKENIZER_BATCH_WINDOW, self._flush
+            )
+
+        return await future
+
+    def _flush(self) -> None:
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        jobs, self.jobs, self.size = self.jobs, [], 0
+        if not jobs:
+            return
+
+        task = asyncio.create_task(self._run(jobs))
+        self.flushes.add(task)
+        task.add_done_callback(self.flushes.discard)
+
+    async def _run(self, jobs: List[_Job]) -> None:
+        submitted_at = time.perf_counter()
+
+        def encode_batch() -> List[List[int] | Exception]:
+            started_at = time.perf_counter()
+            _wait_time.record(started_at - submitted_at)
+            try:
+                return list(map(self._encode, jobs))
+            finally:
+                _run_time.record(time.perf_counter() - started_at)
+
+        _batch_size.record(sum(len(job.texts) for job in jobs))
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                _executor, encode_batch
+            )
+        except Exception as e:
+            results = [e] * len(jobs)
+
+        for job, result in zip(jobs, results):
+            if job.future.done():
+                continue
+            if isinstance(result, Exception):
+                job.future.set_exception(result)
+            else:
+                job.future.set_result(result)
+
+    def _encode(self, job: _Job) -> List[int] | Exception:
+        # Errors are isolated per job, so that a text which fails
+        # the tokenization doesn't fail the other requests in the batch
+        try:
+            return [
+                len(tokens) for tokens in map(self.encoding.encode, job.texts)
+            ]
+        except Exception as e:
+            return e
+
+
+_batchers: Dict[str, TokenizationBatcher] = {}
+
+
+def get_batcher(encoding: Encoding) -> TokenizationBatcher:
+    batcher = _batchers.get(encoding.name)
+    if batcher is None:
+        batcher = _batchers[encoding.name] = TokenizationBatcher(encoding)
+    return batcher
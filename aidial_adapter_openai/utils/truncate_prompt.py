@@ -1,4 +1,4 @@
-from typing import Callable, List, Set, Tuple, TypeVar
+from typing import Callable, List, Tuple, TypeVar
 
 from aidial_sdk.exceptions import (
     TruncatePromptSystemAndLastUserError,
@@ -18,42 +18,52 @@ def truncate_prompt(
     max_prompt_tokens: int,
     initial_prompt_tokens: int,
 ) -> Tuple[List[_T], DiscardedMessages, TruncatedTokens]:
+    """
+    Keeps the system messages and the longest suffix of the non-system messages
+    which fit into `max_prompt_tokens`.
 
-    prompt_tokens = initial_prompt_tokens
+    The tokens of each message are calculated at most once.
+    The non-system messages preceding the first one which doesn't fit
+    are never tokenized, since they are discarded anyway.
+    Returns the kept messages, the indices of the discarded messages
+    in ascending order and the number of tokens in the kept prompt.
+    """
 
-    system_messages_count = 0
-    kept_messages: Set[int] = set()
+    is_system = list(map(is_system_message, messages))
 
-    # Count system messages first
-    for idx, message_holder in enumerate(messages):
-        if is_system_message(message_holder):
-            kept_messages.add(idx)
-            system_messages_count += 1
-            prompt_tokens += message_tokens(message_holder)
+    prompt_tokens = initial_prompt_tokens
+    for message, system in zip(messages, is_system):
+        if system:
+            prompt_tokens += message_tokens(message)
 
     if max_prompt_tokens < prompt_tokens:
         raise TruncatePromptSystemError(max_prompt_tokens, prompt_tokens)
 
-    # Then non-system messages in the reverse order
-    for idx, message_holder in reversed(list(enumerate(messages))):
-        if is_system_message(message_holder):
+    # The non-system messages starting from `first_kept` fit into the prompt
+    first_kept = len(messages)
+    for idx in reversed(range(len(messages))):
+        if is_system[idx]:
             continue
-        calculated_message_tokens = message_tokens(message_holder)
 
-        if max_prompt_tokens < prompt_tokens + calculated_message_tokens:
-            if len(kept_messages) == system_messages_count:
+        tokens = message_tokens(messages[idx])
+        if max_prompt_tokens < prompt_tokens + tokens:
+            if first_kept == len(messages):
                 raise TruncatePromptSystemAndLastUserError(
-                    max_prompt_tokens, prompt_tokens + calculated_message_tokens
+                    max_prompt_tokens, prompt_tokens + tokens
                 )
             break
 
-        prompt_tokens += calculated_message_tokens
-        kept_messages.add(idx)
-
-    new_messages = [
-        message for idx, message in enumerate(messages) if idx in kept_messages
-    ]
+        prompt_tokens += tokens
+        first_kept = idx
+    else:
+        return list(messages), [], prompt_tokens
 
-    discarded_messages = list(set(range(len(messages))) - kept_messages)
+    new_messages: List[_T] = []
+    discarded_messages: DiscardedMessages = []
+    for idx, message in enumerate(messages):
+        if idx >= first_kept or is_system[idx]:
+            new_messages.append(message)
+        else:
+            discarded_messages.append(idx)
 
     return new_messages, discarded_messages, prompt_tokens
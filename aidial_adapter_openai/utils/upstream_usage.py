@@ -0,0 +1,45 @@
+"""
+Requesting the token usage from the upstream in streaming mode,
+so that the adapter doesn't need to tokenize the prompt and the completion.
+"""
+
+import os
+import re
+
+from aidial_adapter_openai.utils.parsers import parse_deployment_list
+
+UPSTREAM_USAGE_DEPLOYMENTS = parse_deployment_list(
+    os.getenv("UPSTREAM_USAGE_DEPLOYMENTS")
+)
+
+# The first Azure OpenAI API version which supports `stream_options`
+AZURE_STREAM_OPTIONS_API_VERSION = "2024-09-01"
+
+_API_VERSION_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+
+
+def supports_stream_options(api_version: str, is_azure: bool) -> bool:
+    if not is_azure:
+        return True
+    match = _API_VERSION_DATE.match(api_version)
+    return match is not None and match[0] >= AZURE_STREAM_OPTIONS_API_VERSION
+
+
+def request_upstream_usage(
+    request: dict, deployment: str, api_version: str, is_azure: bool
+) -> bool:
+    """
+    Enables `stream_options.include_usage` in the streaming request
+    unless the client has already configured the stream options.
+    Returns True when the option was enabled by the adapter.
+    """
+    if (
+        not request.get("stream")
+        or deployment not in UPSTREAM_USAGE_DEPLOYMENTS
+        or request.get("stream_options") is not None
+        or not supports_stream_options(api_version, is_azure)
+    ):
+        return False
+
+    request["stream_options"] = {"include_usage": True}
+    return True
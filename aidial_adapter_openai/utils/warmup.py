@@ -0,0 +1,128 @@
+import asyncio
+from typing import List, Optional, Set
+
+from aidial_sdk.exceptions import HTTPException as DialException
+
+from aidial_adapter_openai.utils.http_client import (
+    get_aiohttp_session,
+    get_http_client,
+    get_pool_key,
+    get_single_pool_stats,
+)
+from aidial_adapter_openai.utils.log_config import logger
+from aidial_adapter_openai.utils.parsers import (
+    AzureOpenAIEndpoint,
+    chat_completions_parser,
+)
+
+
+def get_upstream_base_url(upstream_endpoint: str) -> str:
+    endpoint = chat_completions_parser.parse(upstream_endpoint)
+    if isinstance(endpoint, AzureOpenAIEndpoint):
+        return endpoint.azure_endpoint
+    return endpoint.base_url
+
+
+async def _open_httpx_connection(url: str) -> None:
+    # Any response will do: the connection is returned to the pool afterwards
+    await get_http_client(url).head(url)
+
+
+async def _open_aiohttp_connection(url: str) -> None:
+    async with get_aiohttp_session().head(url):
+        pass
+
+
+async def warm_up_connections(
+    upstream_endpoints: List[str],
+    dial_url: Optional[str],
+    connections: int,
+    timeout: float,
+) -> None:
+    """
+    Opens keep-alive connections to the upstream endpoints and DIAL Core,
+    so that the first requests don't pay for DNS resolution and TLS handshake.
+    Failures are logged and don't prevent the application from starting.
+    """
+    tasks = []
+
+    for upstream_endpoint in upstream_endpoints:
+        try:
+            url = get_upstream_base_url(upstream_endpoint)
+        except DialException:
+            logger.warning(
+                f"Skipping warm-up of invalid upstream endpoint: {upstream_endpoint!r}"
+            )
+            continue
+
+        tasks += [_open_httpx_connection(url) for _ in range(connections)]
+
+    if dial_url is not None:
+        tasks += [
+            _open_aiohttp_connection(dial_url) for _ in range(connections)
+        ]
+
+    if not tasks:
+        return
+
+    logger.info(f"Warming up {len(tasks)} connection(s)")
+
+    try:
+        results = await asyncio.wait_for(
+            asyncio.gather(*tasks, return_exceptions=True), timeout
+        )
+    except asyncio.TimeoutError:
+        logger.warning(f"Connection warm-up timed out after {timeout} seconds")
+        return
+
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning(f"Connection warm-up failed: {result!r}")
+
+
+_prefetch_tasks: Set[asyncio.Task] = set()
+_prefetch_pools: Set[str] = set()
+
+
+async def _prefetch_connection(url: str, pool_key: str) -> None:
+    try:
+        await _open_httpx_connection(url)
+    except Exception as e:
+        logger.debug(f"Connection prefetch failed: {e!r}")
+    finally:
+        _prefetch_pools.discard(pool_key)
+
+
+def prefetch_connection(upstream_endpoint: str) -> None:
+    """
+    Starts opening a connection to the upstream in the background,
+    so that the connection is established while the request is being preprocessed.
+    The connection is opened by a HEAD request to the upstream.
+    Does nothing if the pool already has an idle connection, can't open
+    a new one or a prefetch to the same upstream is in progress.
+    """
+    try:
+        url = get_upstream_base_url(upstream_endpoint)
+    except DialException:
+        return
+
+    pool_key = get_pool_key(url)
+    if pool_key in _prefetch_pools:
+        return
+
+    stats = get_single_pool_stats(pool_key)
+    if stats is not None and (
+        stats.idle_connections > 0
+        or (
+            stats.max_connections is not None
+            and stats.connections >= stats.max_connections
+        )
+    ):
+        return
+
+    _prefetch_pools.add(pool_key)
+    task = asyncio.create_task(_prefetch_connection(url, pool_key))
+
+    # Keeping a reference, so that the task isn't garbage collected
+    _prefetch_tasks.add(task)
+    task.add_done_callback(_prefetch_tasks.discard)
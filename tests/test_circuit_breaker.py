@@ -0,0 +1,111 @@
+from unittest.mock import patch
+
+import httpx
+import pytest
+import respx
+
+from aidial_adapter_openai.utils.circuit_breaker import (
+    CircuitBreaker,
+    CircuitOpenError,
+    get_retry_after,
+)
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [
+        ({}, None),
+        ({"Retry-After": "20"}, 20),
+        ({"retry-after-ms": "1500", "retry-after": "20"}, 1.5),
+        ({"x-ratelimit-reset-requests": "1s"}, 1),
+        ({"x-ratelimit-reset-tokens": "6m0s"}, 360),
+        ({"x-ratelimit-reset-tokens": "20ms"}, 0.02),
+        (
+            {
+                "x-ratelimit-reset-requests": "1s",
+                "x-ratelimit-reset-tokens": "2s",
+            },
+            2,
+        ),
+        ({"x-ratelimit-reset-tokens": "whatever"}, None),
+    ],
+)
+def test_get_retry_after(headers, expected):
+    assert get_retry_after(headers) == expected
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=10)
+
+    breaker.record_status(500, {})
+    breaker.check()
+
+    breaker.record_status(400, {})
+    breaker.record_status(500, {})
+    breaker.check()
+
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError) as exc_info:
+        breaker.check()
+
+    assert exc_info.value.status_code == 503
+
+
+def test_breaker_opens_on_rate_limit_window():
+    breaker = CircuitBreaker(failure_threshold=100, cooldown=10)
+
+    breaker.record_status(429, {"retry-after": "30"})
+    with pytest.raises(CircuitOpenError) as exc_info:
+        breaker.check()
+
+    assert exc_info.value.status_code == 429
+    assert 29 < exc_info.value.retry_after <= 30
+
+    response = exc_info.value.to_fastapi_response()
+    assert response.headers["Retry-After"] == "30"
+
+
+def test_breaker_closes_after_window():
+    breaker = CircuitBreaker(failure_threshold=100, cooldown=10)
+
+    with patch("time.monotonic", return_value=0):
+        breaker.record_status(429, {"retry-after": "5"})
+
+    with patch("time.monotonic", return_value=6):
+        breaker.check()
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_open_circuit_rejects_requests(test_app: httpx.AsyncClient):
+    route = respx.post(
+        "http://circuit-breaker:5001/openai/deployments/text-embedding-ada-002/embeddings?api-version=2023-03-15-preview"
+    ).respond(
+        status_code=429,
+        headers={"Retry-After": "30"},
+        json={"error": {"message": "Rate limit is exceeded", "code": "429"}},
+    )
+
+    async def request():
+        return await test_app.post(
+            "/openai/deployments/text-embedding-ada-002/embeddings?api-version=2023-03-15-preview",
+            json={"input": "Test"},
+            headers={
+                "X-UPSTREAM-KEY": "TEST_API_KEY",
+                "X-UPSTREAM-ENDPOINT": "http://circuit-breaker:5001/openai/deployments/text-embedding-ada-002/embeddings",
+            },
+        )
+
+    with patch(
+        "aidial_adapter_openai.utils.circuit_breaker.CIRCUIT_BREAKER_ENABLED",
+        True,
+    ):
+        response = await request()
+        assert response.status_code == 429
+
+        response = await request()
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "30"
+        assert response.json()["error"]["type"] == "upstream_unavailable"
+
+    assert route.call_count == 1
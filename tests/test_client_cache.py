@@ -0,0 +1,73 @@
+from unittest.mock import patch
+
+from aidial_adapter_openai.utils.client_cache import ClientCache
+from aidial_adapter_openai.utils.parsers import chat_completions_parser
+
+AZURE_ENDPOINT = "https://test.com/openai/deployments/gpt-4/chat/completions"
+OPENAI_ENDPOINT = "https://test.com/v1/chat/completions"
+
+
+def test_same_credentials_reuse_client():
+    endpoint = chat_completions_parser.parse(AZURE_ENDPOINT)
+    params = {"api_key": "key", "api_version": "2024-02-01"}
+
+    assert endpoint.get_client(params) is endpoint.get_client(params)
+
+
+def test_rotated_token_creates_new_client():
+    endpoint = chat_completions_parser.parse(AZURE_ENDPOINT)
+
+    client1 = endpoint.get_client(
+        {"azure_ad_token": "token1", "api_version": "v1"}
+    )
+    client2 = endpoint.get_client(
+        {"azure_ad_token": "token2", "api_version": "v1"}
+    )
+
+    assert client1 is not client2
+
+
+def test_api_version_is_part_of_key():
+    endpoint = chat_completions_parser.parse(AZURE_ENDPOINT)
+
+    client1 = endpoint.get_client({"api_key": "key", "api_version": "v1"})
+    client2 = endpoint.get_client({"api_key": "key", "api_version": "v2"})
+
+    assert client1 is not client2
+
+
+def test_openai_endpoint_reuse_client():
+    endpoint = chat_completions_parser.parse(OPENAI_ENDPOINT)
+
+    assert endpoint.get_client({"api_key": "key"}) is endpoint.get_client(
+        {"api_key": "key"}
+    )
+
+
+def test_lru_eviction():
+    cache: ClientCache[object] = ClientCache(max_size=2, idle_timeout=100)
+
+    a = cache.get("a", object)
+    cache.get("b", object)
+    assert cache.get("a", object) is a
+
+    cache.get("c", object)
+    assert len(cache) == 2
+
+    # "b" was the least recently used entry
+    b = cache.get("b", object)
+    assert cache.get("b", object) is b
+    assert cache.get("a", object) is not a
+
+
+def test_idle_eviction():
+    cache: ClientCache[object] = ClientCache(max_size=10, idle_timeout=5)
+
+    with patch("time.monotonic", return_value=0):
+        a = cache.get("a", object)
+
+    with patch("time.monotonic", return_value=4):
+        assert cache.get("a", object) is a
+
+    with patch("time.monotonic", return_value=10):
+        assert cache.get("a", object) is not a
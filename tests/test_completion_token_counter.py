@@ -0,0 +1,43 @@
+import pytest
+import regex
+
+from aidial_adapter_openai.utils.tokenizer import CompletionTokenCounter
+
+# The pattern of cl100k_base encoding
+CL100K_PATTERN = regex.compile(
+    r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]++[\r\n]*|\s*[\r\n]|\s+(?!\S)|\s+"""
+)
+
+
+def count_pieces(text: str) -> int:
+    return len(CL100K_PATTERN.findall(text))
+
+
+@pytest.mark.parametrize(
+    "parts",
+    [
+        [],
+        ["Hello", ", world", "!"],
+        ["it'", "s", " fine"],
+        ["12", "34", "5"],
+        ["\r", " ", "\n\n", " "],
+        ["def f():\n", "    ", "    return 1", "\n"],
+        ["a", " ", " ", " ", "b"],
+        ["", "text", ""],
+    ],
+)
+def test_incremental_count_matches_full_count(parts):
+    counter = CompletionTokenCounter(count_pieces, CL100K_PATTERN)
+    for part in parts:
+        counter.add(part)
+
+    assert counter.finish() == count_pieces("".join(parts))
+
+
+def test_pending_text_is_bounded():
+    counter = CompletionTokenCounter(count_pieces, CL100K_PATTERN)
+    for _ in range(1000):
+        counter.add("word ")
+
+    assert len(counter.pending) < 20
+    assert counter.finish() == count_pieces("word " * 1000)
@@ -5,7 +5,10 @@ from aidial_sdk.exceptions import HTTPException as DialException
 
 from aidial_adapter_openai.gpt import plain_text_truncate_prompt
 from aidial_adapter_openai.utils.tokenizer import PlainTextTokenizer
-from aidial_adapter_openai.utils.truncate_prompt import DiscardedMessages
+from aidial_adapter_openai.utils.truncate_prompt import (
+    DiscardedMessages,
+    truncate_prompt,
+)
 
 PlainTextMessages = List[dict]
 MaxPromptTokens = int
@@ -159,3 +162,27 @@ def test_discarded_messages_with_error(
     with pytest.raises(DialException) as e_info:
         plain_text_truncate_prompt(messages, max_prompt_tokens, tokenizer)
     assert e_info.value.message == error_message
+
+
+def test_each_message_is_tokenized_at_most_once():
+    roles = ["user", "system", "user", "assistant", "system", "user", "user"]
+    messages = [{"id": idx, "role": role} for idx, role in enumerate(roles)]
+    tokenized: List[int] = []
+
+    def message_tokens(message: dict) -> int:
+        tokenized.append(message["id"])
+        return 1 if message["role"] == "system" else 5
+
+    new_messages, discarded_messages, prompt_tokens = truncate_prompt(
+        messages=messages,
+        message_tokens=message_tokens,
+        is_system_message=lambda message: message["role"] == "system",
+        max_prompt_tokens=19,
+        initial_prompt_tokens=3,
+    )
+
+    assert discarded_messages == [0, 2, 3]
+    assert new_messages == [messages[1], messages[4], messages[5], messages[6]]
+    assert prompt_tokens == 3 + 1 + 1 + 5 + 5
+    # The messages preceding the first one which doesn't fit aren't tokenized
+    assert sorted(tokenized) == [1, 3, 4, 5, 6]
@@ -0,0 +1,131 @@
+import asyncio
+import socket
+from typing import List
+from unittest.mock import patch
+
+import httpcore
+import pytest
+
+from aidial_adapter_openai.utils.dns_cache import (
+    CachingNetworkBackend,
+    CachingResolver,
+    DNSCache,
+)
+
+ADDR_INFO = [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("10.0.0.1", 443))]
+
+
+class RecordingBackend(httpcore.AsyncMockBackend):
+    hosts: List[str]
+
+    def __init__(self):
+        super().__init__(buffer=[])
+        self.hosts = []
+
+    async def connect_tcp(self, host, port, *args, **kwargs):
+        self.hosts.append(host)
+        return await super().connect_tcp(host, port, *args, **kwargs)
+
+
+def mock_getaddrinfo(calls: List[str]):
+    async def getaddrinfo(host, port, **kwargs):
+        calls.append(host)
+        await asyncio.sleep(0)
+        return ADDR_INFO
+
+    return patch.object(
+        asyncio.get_running_loop(), "getaddrinfo", side_effect=getaddrinfo
+    )
+
+
+@pytest.mark.asyncio
+async def test_dns_cache_hits_and_misses():
+    calls: List[str] = []
+    cache = DNSCache(ttl=100)
+
+    with mock_getaddrinfo(calls):
+        assert await cache.getaddrinfo("test.com", 443) == ADDR_INFO
+        assert await cache.getaddrinfo("test.com", 443) == ADDR_INFO
+
+    assert calls == ["test.com"]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_dns_cache_expiration():
+    calls: List[str] = []
+    cache = DNSCache(ttl=0)
+
+    with mock_getaddrinfo(calls):
+        await cache.getaddrinfo("test.com", 443)
+        await cache.getaddrinfo("test.com", 443)
+
+    assert calls == ["test.com", "test.com"]
+
+
+@pytest.mark.asyncio
+async def test_dns_cache_size_is_limited():
+    calls: List[str] = []
+    cache = DNSCache(ttl=100, max_size=2)
+
+    with mock_getaddrinfo(calls):
+        for host in ["a.com", "b.com", "c.com", "c.com"]:
+            await cache.getaddrinfo(host, 443)
+
+    assert len(cache) == 2
+    assert calls == ["a.com", "b.com", "c.com"]
+
+
+@pytest.mark.asyncio
+async def test_dns_cache_prunes_expired_entries():
+    calls: List[str] = []
+    cache = DNSCache(ttl=100, max_size=2)
+
+    with mock_getaddrinfo(calls):
+        await cache.getaddrinfo("a.com", 443)
+        await cache.getaddrinfo("b.com", 443)
+        with patch("time.monotonic", return_value=1e12):
+            await cache.getaddrinfo("c.com", 443)
+
+    # The expired entries are removed before evicting the oldest ones
+    assert len(cache) == 1
+
+
+@pytest.mark.asyncio
+async def test_dns_cache_coalesces_concurrent_lookups():
+    calls: List[str] = []
+    cache = DNSCache(ttl=100)
+
+    with mock_getaddrinfo(calls):
+        await asyncio.gather(
+            *[cache.getaddrinfo("test.com", 443) for _ in range(5)]
+        )
+
+    assert calls == ["test.com"]
+
+
+@pytest.mark.asyncio
+async def test_network_backend_connects_to_resolved_address():
+    calls: List[str] = []
+    backend = RecordingBackend()
+    caching_backend = CachingNetworkBackend(DNSCache(ttl=100), backend)
+
+    with mock_getaddrinfo(calls):
+        await caching_backend.connect_tcp("test.com", 443)
+        await caching_backend.connect_tcp("127.0.0.1", 443)
+
+    assert backend.hosts == ["10.0.0.1", "127.0.0.1"]
+    assert calls == ["test.com"]
+
+
+@pytest.mark.asyncio
+async def test_aiohttp_resolver():
+    calls: List[str] = []
+    resolver = CachingResolver(DNSCache(ttl=100))
+
+    with mock_getaddrinfo(calls):
+        hosts = await resolver.resolve("test.com", 443)
+
+    assert [(h["hostname"], h["host"], h["port"]) for h in hosts] == [
+        ("test.com", "10.0.0.1", 443)
+    ]
@@ -0,0 +1,182 @@
+import asyncio
+from typing import AsyncIterator, List
+from unittest.mock import patch
+
+import pytest
+
+from aidial_adapter_openai.utils.hedging import (
+    HedgingBudget,
+    LatencyTracker,
+    _trackers,
+    hedged_stream,
+)
+from tests.utils.stream import collect
+
+
+class MockStream:
+    def __init__(self, delay: float, items: List[str]) -> None:
+        self.delay = delay
+        self.items = items
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[str]:
+        await asyncio.sleep(self.delay)
+        for item in self.items:
+            yield item
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+def mock_start(streams: List[MockStream]):
+    calls = iter(streams)
+
+    async def start() -> MockStream:
+        return next(calls)
+
+    return start
+
+
+def test_hedging_delay():
+    tracker = LatencyTracker()
+    with patch("aidial_adapter_openai.utils.hedging.HEDGING_DEFAULT_DELAY", 3):
+        assert tracker.hedging_delay() == 3
+
+        for latency in range(1, 101):
+            tracker.add(latency / 100)
+
+        assert tracker.hedging_delay() == 0.95
+
+
+def test_hedging_budget():
+    budget = HedgingBudget(0.5)
+
+    assert budget.try_acquire()
+    assert not budget.try_acquire()
+
+    budget.on_request()
+    assert not budget.try_acquire()
+    budget.on_request()
+    assert budget.try_acquire()
+
+
+@pytest.mark.asyncio
+async def test_fast_primary_is_not_hedged():
+    primary = MockStream(0, ["a", "b"])
+    hedge = MockStream(0, ["c"])
+
+    with patch("aidial_adapter_openai.utils.hedging.HEDGING_DEFAULT_DELAY", 1):
+        stream = await hedged_stream("fast", mock_start([primary, hedge]))
+
+    assert await collect(stream) == ["a", "b"]
+    assert not hedge.closed
+
+
+@pytest.mark.asyncio
+async def test_hedge_wins_over_slow_primary():
+    primary = MockStream(1, ["a"])
+    hedge = MockStream(0, ["b", "c"])
+
+    with patch(
+        "aidial_adapter_openai.utils.hedging.HEDGING_DEFAULT_DELAY", 0.05
+    ):
+        stream = await hedged_stream("slow", mock_start([primary, hedge]))
+
+    assert await collect(stream) == ["b", "c"]
+    assert primary.closed
+
+
+@pytest.mark.asyncio
+async def test_latency_is_measured_from_original_request():
+    primary = MockStream(1, ["a"])
+    hedge = MockStream(0.05, ["b"])
+
+    with patch(
+        "aidial_adapter_openai.utils.hedging.HEDGING_DEFAULT_DELAY", 0.1
+    ), patch.dict(_trackers, clear=True):
+        stream = await hedged_stream("measured", mock_start([primary, hedge]))
+        samples = list(_trackers["measured"].samples)
+
+    assert await collect(stream) == ["b"]
+    # The hedge answered 0.05s after it was sent 0.1s after the primary
+    assert len(samples) == 1
+    assert 0.15 <= samples[0] < 1
+
+
+@pytest.mark.asyncio
+async def test_losing_hedge_is_closed():
+    primary = MockStream(0.1, ["a"])
+    hedge = MockStream(0.1, ["b"])
+
+    with patch(
+        "aidial_adapter_openai.utils.hedging.HEDGING_DEFAULT_DELAY", 0.09
+    ):
+        stream = await hedged_stream("tie", mock_start([primary, hedge]))
+
+    assert await collect(stream) == ["a"]
+    assert hedge.closed
+
+
+@pytest.mark.asyncio
+async def test_failed_hedge_falls_back_to_primary():
+    primary = MockStream(0.1, ["a"])
+    calls = 0
+
+    async def start():
+        nonlocal calls
+        calls += 1
+        if calls == 2:
+            raise ValueError("Upstream failure")
+        return primary
+
+    with patch(
+        "aidial_adapter_openai.utils.hedging.HEDGING_DEFAULT_DELAY", 0.01
+    ):
+        stream = await hedged_stream("failing", start)
+
+    assert await collect(stream) == ["a"]
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_error_response_doesnt_win():
+    primary = MockStream(0.1, ["a"])
+    hedge = MockStream(0, ["error"])
+
+    with patch(
+        "aidial_adapter_openai.utils.hedging.HEDGING_DEFAULT_DELAY", 0.01
+    ):
+        stream = await hedged_stream(
+            "error-response",
+            mock_start([primary, hedge]),
+            lambda item: item == "error",
+        )
+
+    assert await collect(stream) == ["a"]
+    assert hedge.closed
+
+
+@pytest.mark.asyncio
+async def test_error_response_is_returned_when_all_attempts_fail():
+    primary = MockStream(0.1, ["error", "details"])
+    calls = 0
+
+    async def start():
+        nonlocal calls
+        calls += 1
+        if calls == 2:
+            raise ValueError("Upstream failure")
+        return primary
+
+    with patch(
+        "aidial_adapter_openai.utils.hedging.HEDGING_DEFAULT_DELAY", 0.01
+    ):
+        stream = await hedged_stream(
+            "all-failing", start, lambda item: item == "error"
+        )
+
+    assert await collect(stream) == ["error", "details"]
+    assert calls == 2
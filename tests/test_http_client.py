@@ -0,0 +1,114 @@
+from unittest.mock import patch
+
+import httpcore
+import httpx
+import pytest
+import respx
+
+from aidial_adapter_openai.utils.http_client import (
+    PoolConfig,
+    get_http_client,
+    get_pool_config,
+    get_pool_key,
+    get_pool_stats,
+    get_single_pool_stats,
+)
+
+
+@pytest.mark.parametrize(
+    "url, expected_key",
+    [
+        (None, "*"),
+        ("", "*"),
+        (
+            "https://Test.openai.azure.com/openai/deployments/x",
+            "test.openai.azure.com",
+        ),
+        ("http://localhost:5001/v1/chat/completions", "localhost:5001"),
+    ],
+)
+def test_pool_key(url, expected_key):
+    assert get_pool_key(url) == expected_key
+
+
+def test_pool_config():
+    pools = {
+        "*": PoolConfig(max_connections=10),
+        "a.com": PoolConfig(max_connections=20),
+        "b.com:8080": PoolConfig(max_connections=30),
+    }
+
+    with patch(
+        "aidial_adapter_openai.utils.http_client.HTTP_CLIENT_POOLS", pools
+    ):
+        assert get_pool_config("a.com").max_connections == 20
+        assert get_pool_config("a.com:443").max_connections == 20
+        assert get_pool_config("b.com:8080").max_connections == 30
+        assert get_pool_config("b.com").max_connections == 10
+        assert get_pool_config("c.com").max_connections == 10
+
+
+def test_pools_are_partitioned_by_host():
+    client_a = get_http_client("https://a.com/openai/deployments/x")
+    client_b = get_http_client("https://b.com/openai/deployments/x")
+
+    assert client_a is not client_b
+    assert client_a is get_http_client("https://a.com/v1/embeddings")
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_pool_stats():
+    respx.get("https://stats.com/").respond(status_code=200)
+
+    await get_http_client("https://stats.com/").get("https://stats.com/")
+
+    stats = get_pool_stats()["stats.com"]
+    assert stats.queued_requests == 0
+    assert stats.max_connections == PoolConfig().max_connections
+    assert get_single_pool_stats("stats.com") == stats
+    assert get_single_pool_stats("unknown.com") is None
+
+
+def test_http2_fallback_without_h2():
+    pools = {"http2.com": PoolConfig(http2=True)}
+
+    with patch(
+        "aidial_adapter_openai.utils.http_client.HTTP_CLIENT_POOLS", pools
+    ), patch(
+        "aidial_adapter_openai.utils.http_client._is_http2_available",
+        return_value=False,
+    ):
+        client = get_http_client("https://http2.com/v1/chat/completions")
+
+    assert client._transport._pool._http2 is False  # type: ignore
+
+
+def test_http2_enabled():
+    pools = {"h2.com": PoolConfig(http2=True)}
+
+    with patch(
+        "aidial_adapter_openai.utils.http_client.HTTP_CLIENT_POOLS", pools
+    ):
+        client = get_http_client("https://h2.com/v1/chat/completions")
+
+    assert client._transport._pool._http2 is True  # type: ignore
+
+
+def test_environment_proxies(monkeypatch):
+    monkeypatch.setenv("HTTPS_PROXY", "http://proxy.local:3128")
+    monkeypatch.setenv("NO_PROXY", "direct.com")
+
+    proxied = get_http_client("https://proxied.com/v1/chat/completions")
+    direct = get_http_client("https://direct.com/v1/chat/completions")
+
+    proxy_transport = proxied._transport_for_url(
+        httpx.URL("https://proxied.com/")
+    )
+    assert proxy_transport is not proxied._transport
+    assert isinstance(proxy_transport._pool, httpcore.AsyncHTTPProxy)  # type: ignore
+
+    direct_transport = direct._transport_for_url(
+        httpx.URL("https://direct.com/")
+    )
+    assert direct_transport is direct._transport
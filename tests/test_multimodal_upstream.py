@@ -0,0 +1,113 @@
+from typing import AsyncIterator
+from unittest.mock import patch
+
+import pytest
+import respx
+from fastapi.responses import Response
+
+from aidial_adapter_openai.gpt4_multi_modal.chat_completion import (
+    gpt4o_chat_completion,
+    predict_non_stream,
+    predict_stream,
+)
+from aidial_adapter_openai.utils.sse_stream import parse_openai_sse_stream
+from aidial_adapter_openai.utils.tokenizer import MultiModalTokenizer
+from tests.utils.stream import OpenAIStream, chunk, single_choice_chunk
+from tests.utils.tokenizer import MockEncoding, patch_encoding
+
+API_URL = "http://localhost:5001/openai/deployments/gpt-4o/chat/completions?api-version=2024-02-01"
+
+
+async def collect(stream: AsyncIterator) -> list:
+    return [item async for item in stream]
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_predict_stream():
+    mock_stream = OpenAIStream(
+        single_choice_chunk(delta={"role": "assistant", "content": "Hi"}),
+        single_choice_chunk(delta={}, finish_reason="stop"),
+    )
+
+    respx.post(API_URL).respond(
+        status_code=200,
+        content=mock_stream.to_content(),
+        content_type="text/event-stream",
+    )
+
+    response = await predict_stream(API_URL, {"api-key": "KEY"}, {})
+    assert not isinstance(response, Response)
+
+    chunks = await collect(parse_openai_sse_stream(response))
+    assert chunks == mock_stream.chunks
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_predict_stream_upstream_error():
+    respx.post(API_URL).respond(
+        status_code=429, json={"error": {"message": "Too many requests"}}
+    )
+
+    response = await predict_stream(API_URL, {"api-key": "KEY"}, {})
+    assert isinstance(response, Response)
+    assert response.status_code == 429
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_predict_non_stream():
+    respx.post(API_URL).respond(status_code=200, json={"id": "chatcmpl-test"})
+
+    response = await predict_non_stream(API_URL, {"api-key": "KEY"}, {})
+    assert response == {"id": "chatcmpl-test"}
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_tools_are_not_tokenized_when_usage_is_reported():
+    usage = {"completion_tokens": 1, "prompt_tokens": 2, "total_tokens": 3}
+    mock_stream = OpenAIStream(
+        single_choice_chunk(delta={"role": "assistant", "content": "Hi"}),
+        single_choice_chunk(delta={}, finish_reason="stop"),
+        chunk(choices=[], usage=usage),
+    )
+    respx.post(
+        "http://localhost:5001/openai/deployments/gpt-4o/chat/completions?api-version=2024-10-21"
+    ).respond(
+        status_code=200,
+        content=mock_stream.to_content(),
+        content_type="text/event-stream",
+    )
+
+    with patch_encoding(MockEncoding("tools-encoding")):
+        tokenizer = MultiModalTokenizer("gpt-4o")
+
+    tool = {"type": "function", "function": {"name": "ping"}}
+    with patch(
+        "aidial_adapter_openai.utils.upstream_usage.UPSTREAM_USAGE_DEPLOYMENTS",
+        ["gpt-4o"],
+    ), patch.object(
+        tokenizer,
+        "calculate_tools_tokens",
+        wraps=tokenizer.calculate_tools_tokens,
+    ) as calculate_tools_tokens:
+        response = await gpt4o_chat_completion(
+            {
+                "messages": [{"role": "user", "content": "Hello"}],
+                "tools": [tool],
+                "stream": True,
+            },
+            "gpt-4o",
+            "http://localhost:5001/openai/deployments/gpt-4o/chat/completions",
+            {"api_key": "KEY"},
+            True,
+            None,
+            "2024-10-21",
+            tokenizer,
+        )
+        chunks = await collect(response)
+
+    assert chunks[-1]["usage"] == usage
+    assert not calculate_tools_tokens.called
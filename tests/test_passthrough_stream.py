@@ -0,0 +1,186 @@
+import json
+from typing import List
+from unittest.mock import patch
+
+import pytest
+import respx
+from fastapi.responses import StreamingResponse
+
+from aidial_adapter_openai.gpt import gpt_chat_completion
+from aidial_adapter_openai.utils.passthrough_stream import (
+    _relay_events,
+    is_passthrough_enabled,
+)
+from aidial_adapter_openai.utils.sse_stream import format_chunk
+from aidial_adapter_openai.utils.tokenizer import PlainTextTokenizer
+from tests.utils.stream import (
+    OpenAIStream,
+    chunk,
+    collect,
+    mock_prompt_tokens,
+    single_choice_chunk,
+    to_stream,
+)
+from tests.utils.tokenizer import (
+    bytes_encoding,
+    create_token_counter,
+    patch_encoding,
+)
+
+UPSTREAM_URL = (
+    "http://passthrough.com/openai/deployments/gpt-4/chat/completions"
+)
+USAGE = {"completion_tokens": 1, "prompt_tokens": 2, "total_tokens": 3}
+
+
+@pytest.fixture
+def tokenizer():
+    with patch_encoding(bytes_encoding()):
+        yield PlainTextTokenizer("passthrough-model")
+
+
+@pytest.fixture(autouse=True)
+def passthrough_deployment():
+    with patch(
+        "aidial_adapter_openai.utils.passthrough_stream.PASSTHROUGH_STREAMING_DEPLOYMENTS",
+        ["gpt-4"],
+    ):
+        yield
+
+
+@pytest.mark.parametrize(
+    "request_body, expected",
+    [
+        ({"stream": True}, True),
+        ({"stream": False}, False),
+        ({"stream": True, "max_prompt_tokens": 10}, False),
+    ],
+)
+def test_is_passthrough_enabled(request_body, expected):
+    assert is_passthrough_enabled("gpt-4", request_body) == expected
+    assert not is_passthrough_enabled("gpt-4o", request_body)
+
+
+async def call_gpt(
+    tokenizer,
+    upstream: OpenAIStream,
+    api_version: str = "2023-03-15-preview",
+    **request,
+):
+    respx.post(UPSTREAM_URL + f"?api-version={api_version}").respond(
+        status_code=200,
+        content=upstream.to_content(),
+        content_type="text/event-stream",
+    )
+
+    return await gpt_chat_completion(
+        data={
+            "model": "gpt-4",
+            "messages": [{"role": "user", "content": "Hello"}],
+            "stream": True,
+            **request,
+        },
+        deployment_id="gpt-4",
+        upstream_endpoint=UPSTREAM_URL,
+        creds={"api_key": "TEST_API_KEY"},
+        api_version=api_version,
+        tokenizer=tokenizer,
+    )
+
+
+async def call_passthrough(
+    tokenizer, upstream: OpenAIStream, **request
+) -> List[bytes]:
+    response = await call_gpt(tokenizer, upstream, **request)
+
+    assert isinstance(response, StreamingResponse)
+    return [data async for data in response.body_iterator]  # type: ignore
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_upstream_events_are_relayed_verbatim(tokenizer):
+    upstream = OpenAIStream(
+        single_choice_chunk(delta={"role": "assistant", "content": "Hi"}),
+        single_choice_chunk(delta={}, finish_reason="stop"),
+        chunk(choices=[], usage=USAGE),
+    )
+
+    content = b"".join(
+        await call_passthrough(
+            tokenizer, upstream, stream_options={"include_usage": True}
+        )
+    )
+
+    assert content == upstream.to_content().encode()
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_upstream_usage_disables_passthrough(tokenizer):
+    upstream = OpenAIStream(
+        single_choice_chunk(delta={"role": "assistant", "content": "Hi"}),
+        single_choice_chunk(delta={}, finish_reason="stop"),
+        chunk(choices=[], usage=USAGE),
+    )
+
+    with patch(
+        "aidial_adapter_openai.utils.upstream_usage.UPSTREAM_USAGE_DEPLOYMENTS",
+        ["gpt-4"],
+    ):
+        response = await call_gpt(tokenizer, upstream, api_version="2024-10-21")
+
+    assert not isinstance(response, StreamingResponse)
+    chunks = [item async for item in response]  # type: ignore
+    assert all(item["choices"] for item in chunks)
+    assert chunks[-1]["usage"] == USAGE
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_missing_fields_are_sent_in_trailing_chunk(tokenizer):
+    upstream = OpenAIStream(
+        single_choice_chunk(delta={"role": "assistant", "content": "Hi"}),
+    )
+
+    content = b"".join(await call_passthrough(tokenizer, upstream))
+
+    events = content.decode().split("\n\n")
+    assert events[-2:] == ["data: [DONE]", ""]
+    assert json.loads(events[0].removeprefix("data: ")) == upstream.chunks[0]
+
+    trailing_chunk = json.loads(events[1].removeprefix("data: "))
+    assert trailing_chunk["id"] == upstream.chunks[0]["id"]
+    assert trailing_chunk["choices"][0]["finish_reason"] == "length"
+    # "Hello" and "user" are 9 tokens, plus 3 per message and 3 per request
+    assert trailing_chunk["usage"] == {
+        "completion_tokens": 2,
+        "prompt_tokens": 15,
+        "total_tokens": 17,
+    }
+
+
+@pytest.mark.asyncio
+async def test_invalid_upstream_event_terminates_stream():
+    upstream = [
+        format_chunk(single_choice_chunk(delta={"content": "Hi"})),
+        b"foo: bar\n\n",
+    ]
+
+    content = b"".join(
+        await collect(
+            _relay_events(
+                to_stream(upstream),
+                get_prompt_tokens=mock_prompt_tokens(1),
+                create_token_counter=create_token_counter,
+                deployment="gpt-4",
+            )
+        )
+    )
+
+    events = content.decode().split("\n\n")
+    assert events[0] == upstream[0].decode().removesuffix("\n\n")
+    assert "usage" in json.loads(events[1].removeprefix("data: "))
+    error = json.loads(events[2].removeprefix("data: "))["error"]
+    assert error["message"] == "Invalid chunk format"
+    assert events[-2:] == ["data: [DONE]", ""]
@@ -0,0 +1,123 @@
+from unittest.mock import patch
+
+import pytest
+import respx
+
+from aidial_adapter_openai.gpt import gpt_chat_completion
+from aidial_adapter_openai.utils.tokenizer import PlainTextTokenizer
+from tests.utils.stream import OpenAIStream, collect, single_choice_chunk
+from tests.utils.tokenizer import bytes_encoding, patch_encoding
+
+
+@pytest.fixture
+def tokenizer():
+    # The worst case of a byte-level encoding: a token per byte
+    with patch_encoding(bytes_encoding()):
+        yield PlainTextTokenizer("upper-bound-model")
+
+
+@pytest.mark.parametrize(
+    "messages",
+    [
+        [],
+        [{"role": "user", "content": "Hello"}],
+        [
+            {"role": "system", "content": "Привет, 世界! 👋"},
+            {"role": "user", "content": "text", "name": "bob"},
+            {"role": "assistant", "content": None},
+            {"role": "user", "content": [{"type": "text", "text": "ünï"}]},
+        ],
+    ],
+)
+def test_upper_bound_holds_for_worst_case_encoding(tokenizer, messages):
+    assert tokenizer.calculate_prompt_tokens_upper_bound(
+        messages
+    ) == tokenizer.calculate_prompt_tokens(messages)
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_truncation_is_skipped_when_prompt_fits(tokenizer):
+    respx.post(
+        "http://upper-bound.com/openai/deployments/gpt-4/chat/completions?api-version=2023-03-15-preview"
+    ).respond(
+        json={
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 1695940483,
+            "model": "gpt-4",
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": "Hi"},
+                }
+            ],
+            "usage": {
+                "prompt_tokens": 9,
+                "completion_tokens": 1,
+                "total_tokens": 10,
+            },
+        }
+    )
+
+    with patch(
+        "aidial_adapter_openai.gpt.plain_text_truncate_prompt"
+    ) as truncate_prompt:
+        response = await gpt_chat_completion(
+            data={
+                "model": "gpt-4",
+                "messages": [{"role": "user", "content": "Hello"}],
+                "max_prompt_tokens": 15,
+            },
+            deployment_id="gpt-4",
+            upstream_endpoint="http://upper-bound.com/openai/deployments/gpt-4/chat/completions",
+            creds={"api_key": "TEST_API_KEY"},
+            api_version="2023-03-15-preview",
+            tokenizer=tokenizer,
+        )
+
+    assert not truncate_prompt.called
+    assert response["statistics"] == {"discarded_messages": []}
+
+
+@respx.mock
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_prompt_tokens", [None, 1000])
+async def test_prompt_is_tokenized_once(tokenizer, max_prompt_tokens):
+    upstream = OpenAIStream(
+        single_choice_chunk(delta={"role": "assistant", "content": "Hi"}),
+        single_choice_chunk(delta={}, finish_reason="stop"),
+    )
+    respx.post(
+        "http://upper-bound.com/openai/deployments/gpt-4/chat/completions?api-version=2023-03-15-preview"
+    ).respond(
+        content=upstream.to_content(),
+        content_type="text/event-stream",
+    )
+
+    data = {
+        "model": "gpt-4",
+        "messages": [{"role": "user", "content": "Hello"}],
+        "stream": True,
+    }
+    if max_prompt_tokens is not None:
+        data["max_prompt_tokens"] = max_prompt_tokens
+
+    with patch.object(
+        tokenizer,
+        "calculate_prompt_tokens_async",
+        wraps=tokenizer.calculate_prompt_tokens_async,
+    ) as calculate_prompt_tokens:
+        response = await gpt_chat_completion(
+            data=data,
+            deployment_id="gpt-4",
+            upstream_endpoint="http://upper-bound.com/openai/deployments/gpt-4/chat/completions",
+            creds={"api_key": "TEST_API_KEY"},
+            api_version="2023-03-15-preview",
+            tokenizer=tokenizer,
+        )
+        chunks = await collect(response)  # type: ignore
+
+    assert calculate_prompt_tokens.call_count == 1
+    assert chunks[-1]["usage"]["prompt_tokens"] == 3 + 3 + 4 + 5
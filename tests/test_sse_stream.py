@@ -0,0 +1,116 @@
+import json
+from typing import AsyncIterator, List, TypeVar
+from unittest.mock import patch
+
+import pytest
+
+from aidial_adapter_openai.utils.sse_stream import (
+    END_CHUNK,
+    SSEDecoder,
+    SSEStreamingResponse,
+    format_chunk,
+    parse_openai_sse_stream,
+    to_openai_sse_stream,
+)
+
+T = TypeVar("T")
+
+CHUNK = {"id": "chatcmpl-test", "choices": [{"delta": {"content": "Привет"}}]}
+
+
+async def to_stream(items: List[T]) -> AsyncIterator[T]:
+    for item in items:
+        yield item
+
+
+def test_format_chunk():
+    event = format_chunk(CHUNK)
+
+    assert isinstance(event, bytes)
+    assert event.startswith(b"data: {") and event.endswith(b"}\n\n")
+    assert json.loads(event[len(b"data: ") :]) == CHUNK
+
+
+def test_format_chunk_uses_orjson():
+    with patch(
+        "aidial_adapter_openai.utils.sse_stream.json.dumps",
+        side_effect=AssertionError("orjson must be used"),
+    ):
+        event = format_chunk({"content": "Привет"})
+
+    assert event == 'data: {"content":"Привет"}\n\n'.encode()
+
+
+def test_format_chunk_falls_back_on_unsupported_values():
+    event = format_chunk({"value": 2**70})
+    assert event == b'data: {"value":1180591620717411303424}\n\n'
+
+
+def test_end_chunk():
+    assert END_CHUNK == b"data: [DONE]\n\n"
+
+
+@pytest.mark.asyncio
+async def test_sse_streaming_response():
+    response = SSEStreamingResponse(to_stream([CHUNK, CHUNK]))
+    assert response.media_type == "text/event-stream"
+
+    events = [event async for event in response.body_iterator]
+    assert events == [format_chunk(CHUNK), format_chunk(CHUNK), END_CHUNK]
+
+
+@pytest.mark.asyncio
+async def test_to_openai_sse_stream_emits_bytes():
+    events = [event async for event in to_openai_sse_stream(to_stream([]))]
+    assert events == [END_CHUNK]
+
+
+def decode(*parts: bytes) -> List[bytes]:
+    decoder = SSEDecoder()
+    events = [event for part in parts for event in decoder.feed(part)]
+    return events + decoder.close()
+
+
+def test_decoder_handles_arbitrary_boundaries():
+    content = b"data: 1\n\ndata: 22\r\n\r\ndata: 333\n\n"
+    expected = [b"1", b"22", b"333"]
+
+    for size in range(1, len(content) + 1):
+        parts = [content[i : i + size] for i in range(0, len(content), size)]
+        assert decode(*parts) == expected
+
+
+def test_decoder_handles_multi_line_data_and_comments():
+    assert decode(
+        b"\xef\xbb\xbf: keep-alive\n\n",
+        b"event: chunk\nid: 1\ndata: {\ndata:}\n\n",
+        b"data: tail",
+    ) == [b"{\n}", b"tail"]
+
+
+@pytest.mark.asyncio
+async def test_parse_openai_sse_stream():
+    content = format_chunk(CHUNK) + b": comment\n\n" + END_CHUNK
+    parts = [content[i : i + 7] for i in range(0, len(content), 7)]
+
+    chunks = [
+        chunk async for chunk in parse_openai_sse_stream(to_stream(parts))
+    ]
+    assert chunks == [CHUNK]
+
+
+@pytest.mark.parametrize(
+    "content, message",
+    [
+        (b"data: {invalid\n\n", "Can't parse chunk to JSON"),
+        (b"data: \xff\n\n", "Can't parse chunk to JSON"),
+        (b"invalid\n\n", "Invalid chunk format"),
+    ],
+)
+@pytest.mark.asyncio
+async def test_parse_openai_sse_stream_errors(content: bytes, message: str):
+    chunks = [
+        chunk async for chunk in parse_openai_sse_stream(to_stream([content]))
+    ]
+    assert len(chunks) == 1
+    assert chunks[0]["error"]["message"] == message
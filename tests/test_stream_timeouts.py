@@ -0,0 +1,105 @@
+import asyncio
+from time import monotonic
+from typing import AsyncIterator, List
+from unittest.mock import patch
+
+import pytest
+from aidial_sdk.exceptions import HTTPException as DialException
+
+from aidial_adapter_openai.env import STREAM_TIMEOUTS, StreamTimeouts
+from aidial_adapter_openai.utils.streaming import (
+    StreamTimeoutError,
+    generate_stream,
+    timeout_stream,
+    wait_for_stream_start,
+)
+from tests.utils.stream import collect, mock_prompt_tokens, single_choice_chunk
+from tests.utils.tokenizer import create_token_counter
+
+
+async def delayed_stream(
+    delays: List[float], chunks: List[dict]
+) -> AsyncIterator[dict]:
+    for delay, chunk in zip(delays, chunks):
+        await asyncio.sleep(delay)
+        yield chunk
+
+
+@pytest.mark.asyncio
+async def test_no_timeouts():
+    stream = delayed_stream([0, 0], [{"a": 1}, {"b": 2}])
+    assert await collect(timeout_stream(stream, None, None)) == [
+        {"a": 1},
+        {"b": 2},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_first_chunk_timeout():
+    stream = delayed_stream([0.2], [{"a": 1}])
+    with pytest.raises(StreamTimeoutError, match="first chunk"):
+        await collect(timeout_stream(stream, 0.05, 1))
+
+
+@pytest.mark.asyncio
+async def test_idle_timeout():
+    stream = delayed_stream([0, 0.2], [{"a": 1}, {"b": 2}])
+    with pytest.raises(StreamTimeoutError, match="next chunk"):
+        await collect(timeout_stream(stream, 1, 0.05))
+
+
+@pytest.mark.asyncio
+async def test_first_chunk_timeout_counts_from_start():
+    # The time spent before the stream was started is deducted
+    stream = delayed_stream([0.1], [{"a": 1}])
+    with pytest.raises(StreamTimeoutError, match="first chunk"):
+        await collect(timeout_stream(stream, 0.15, 1, monotonic() - 0.1))
+
+
+@pytest.mark.asyncio
+async def test_stream_start_timeout():
+    timeouts = {"gpt-4": StreamTimeouts(first_chunk_timeout=0.05)}
+    with patch.dict(STREAM_TIMEOUTS, timeouts):
+        with pytest.raises(DialException) as exc_info:
+            await wait_for_stream_start(
+                "gpt-4", asyncio.sleep(0.2), monotonic()
+            )
+
+    assert exc_info.value.status_code == 504
+    assert exc_info.value.type == "timeout"
+
+
+@pytest.mark.asyncio
+async def test_stream_start_within_timeout():
+    timeouts = {"gpt-4": StreamTimeouts(first_chunk_timeout=1)}
+    with patch.dict(STREAM_TIMEOUTS, timeouts):
+        result = await wait_for_stream_start(
+            "gpt-4", asyncio.sleep(0, "stream"), monotonic()
+        )
+
+    assert result == "stream"
+
+
+@pytest.mark.asyncio
+async def test_generate_stream_reports_timeout():
+    chunks = [
+        single_choice_chunk(delta={"role": "assistant", "content": "Hi"}),
+        single_choice_chunk(delta={}, finish_reason="stop"),
+    ]
+
+    timeouts = {"gpt-4": StreamTimeouts(idle_timeout=0.05)}
+    with patch.dict(STREAM_TIMEOUTS, timeouts):
+        result = await collect(
+            generate_stream(
+                get_prompt_tokens=mock_prompt_tokens(1),
+                create_token_counter=create_token_counter,
+                deployment="gpt-4",
+                discarded_messages=None,
+                stream=delayed_stream([0, 0.2], chunks),
+            )
+        )
+
+    assert result[0]["choices"] == chunks[0]["choices"]
+    assert result[0]["usage"]["completion_tokens"] == 1
+    assert result[-1]["error"]["code"] == "504"
+    assert result[-1]["error"]["type"] == "timeout"
@@ -0,0 +1,65 @@
+from aidial_adapter_openai.utils.token_count_cache import (
+    TokenCountCache,
+    token_count_cache,
+)
+from aidial_adapter_openai.utils.tokenizer import PlainTextTokenizer
+from tests.utils.tokenizer import MockEncoding, patch_encoding
+
+long_text = "word " * 100
+
+
+def test_short_texts_are_not_cached():
+    cache = TokenCountCache(max_bytes=1024)
+    assert cache.get_key("cl100k_base", ["short text"]) is None
+    assert cache.get_key("cl100k_base", [long_text]) is not None
+
+
+def test_key_depends_on_encoding_and_texts():
+    cache = TokenCountCache(max_bytes=1024)
+    key = cache.get_key("cl100k_base", [long_text, "a"])
+
+    assert key == cache.get_key("cl100k_base", [long_text, "a"])
+    assert key != cache.get_key("o200k_base", [long_text, "a"])
+    assert key != cache.get_key("cl100k_base", [long_text + "a"])
+    assert key != cache.get_key("cl100k_base", [long_text, "", "a"])
+
+
+def test_disabled_cache():
+    cache = TokenCountCache(max_bytes=0)
+    assert cache.get_key("cl100k_base", [long_text]) is None
+
+
+def test_eviction_by_memory():
+    cache = TokenCountCache(max_bytes=1000)
+    keys = [
+        cache.get_key("cl100k_base", [long_text + str(idx)])
+        for idx in range(10)
+    ]
+
+    for idx, key in enumerate(keys):
+        assert key is not None
+        cache.put(key, idx)
+
+    assert 0 < len(cache) < 10
+    assert cache.size_bytes <= 1000
+    assert cache.get(keys[0]) is None  # type: ignore
+    assert cache.get(keys[-1]) == 9  # type: ignore
+
+
+def test_history_is_not_retokenized():
+    encoding = MockEncoding("cached-encoding")
+    with patch_encoding(encoding):
+        tokenizer = PlainTextTokenizer("cached-model")
+    token_count_cache.clear()
+
+    history = [
+        {"role": "system", "content": long_text},
+        {"role": "user", "content": "Hi"},
+    ]
+    tokens = tokenizer.calculate_prompt_tokens(history)
+    assert long_text in encoding.encoded
+
+    encoding.encoded.clear()
+    history.append({"role": "assistant", "content": "Hello"})
+    assert tokenizer.calculate_prompt_tokens(history) == tokens + 3 + 2
+    assert long_text not in encoding.encoded
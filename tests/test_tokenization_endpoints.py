@@ -0,0 +1,90 @@
+import pytest
+
+from tests.utils.tokenizer import bytes_encoding, patch_encoding
+
+
+@pytest.fixture(autouse=True)
+def mock_encoding():
+    with patch_encoding(bytes_encoding()):
+        yield
+
+
+# 3 tokens per request + (3 tokens per message + "user" + "Hello")
+HELLO = {"role": "user", "content": "Hello"}
+HELLO_TOKENS = 3 + 3 + 4 + 5
+
+
+@pytest.mark.asyncio
+async def test_tokenize_batch(test_app):
+    response = await test_app.post(
+        "/openai/deployments/tokenize-model/tokenize",
+        json={
+            "inputs": [
+                {"type": "string", "value": "abc"},
+                {"type": "request", "value": {"messages": [HELLO]}},
+                {"type": "request", "value": {"messages": "invalid"}},
+                {"type": "request", "value": {"messages": [{"content": "Hi"}]}},
+                {"type": "unknown", "value": 1},
+            ]
+        },
+    )
+
+    assert response.status_code == 200
+    outputs = response.json()["outputs"]
+    assert outputs[:3] == [
+        {"status": "success", "token_count": 3},
+        {"status": "success", "token_count": HELLO_TOKENS},
+        {
+            "status": "error",
+            "error": "Invalid input: value.messages: value is not a valid list",
+        },
+    ]
+    assert outputs[3] == {
+        "status": "error",
+        "error": "Invalid input: value.messages.0.role: field required",
+    }
+    assert outputs[4]["status"] == "error"
+    assert "discriminator 'type'" in outputs[4]["error"]
+
+
+@pytest.mark.asyncio
+async def test_truncate_prompt_batch(test_app):
+    system = {"role": "system", "content": "Be brief"}
+    messages = [system, HELLO, HELLO, HELLO]
+
+    response = await test_app.post(
+        "/openai/deployments/truncate-model/truncate_prompt",
+        json={
+            "inputs": [
+                {"messages": messages, "max_prompt_tokens": 1000},
+                {"messages": messages, "max_prompt_tokens": 40},
+                {"messages": messages, "max_prompt_tokens": 5},
+                {"messages": messages},
+                {"messages": [{"content": "Hi"}], "max_prompt_tokens": 5},
+            ]
+        },
+    )
+
+    assert response.status_code == 200
+    outputs = response.json()["outputs"]
+    assert outputs[0] == {"status": "success", "discarded_messages": []}
+    assert outputs[1] == {"status": "success", "discarded_messages": [1, 2]}
+    assert outputs[2]["status"] == "error"
+    assert outputs[3] == {
+        "status": "error",
+        "error": "'max_prompt_tokens' must be a positive integer",
+    }
+    assert outputs[4] == {
+        "status": "error",
+        "error": "Invalid input: messages.0.role: field required",
+    }
+
+
+@pytest.mark.asyncio
+async def test_invalid_batch(test_app):
+    response = await test_app.post(
+        "/openai/deployments/tokenize-model/tokenize",
+        json={"inputs": {"type": "string", "value": "abc"}},
+    )
+
+    assert response.status_code == 400
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from aidial_adapter_openai.utils.tokenizer import PlainTextTokenizer
+from aidial_adapter_openai.utils.tokenizer_pool import (
+    TokenizationBatcher,
+    get_queued_jobs,
+    run_tokenization,
+)
+from tests.utils.tokenizer import MockEncoding, patch_encoding
+
+
+@pytest.mark.asyncio
+async def test_small_jobs_run_on_event_loop():
+    thread = await run_tokenization(10, threading.current_thread)
+    assert thread is threading.current_thread()
+
+
+@pytest.mark.asyncio
+async def test_large_jobs_run_on_pool():
+    with patch(
+        "aidial_adapter_openai.utils.tokenizer_pool.TOKENIZER_OFFLOAD_THRESHOLD",
+        100,
+    ):
+        thread = await run_tokenization(100, threading.current_thread)
+
+    assert thread.name.startswith("tokenizer")
+    assert get_queued_jobs() == 0
+
+
+@pytest.mark.asyncio
+@patch("aidial_adapter_openai.utils.tokenizer.encoding_for_model")
+async def test_async_tokenizer_api(encoding_for_model):
+    encoding_for_model.return_value.encode = lambda text: text.split()
+    tokenizer = PlainTextTokenizer("pool-model")
+
+    messages = [
+        {"role": "user", "content": "a b c"},
+        {"role": "assistant", "content": [{"type": "text", "text": "d e"}]},
+    ]
+    assert tokenizer.calculate_prompt_size(messages) == 4 + 5 + 9 + 3
+
+    with patch(
+        "aidial_adapter_openai.utils.tokenizer_pool.TOKENIZER_OFFLOAD_THRESHOLD",
+        1,
+    ):
+        assert await tokenizer.calculate_text_tokens_async("a b") == 2
+        assert await tokenizer.calculate_prompt_tokens_async(
+            messages
+        ) == tokenizer.calculate_prompt_tokens(messages)
+
+
+@pytest.mark.asyncio
+async def test_batcher_merges_concurrent_jobs():
+    encoding = MockEncoding()
+    batcher = TokenizationBatcher(encoding)  # type: ignore
+
+    with patch(
+        "aidial_adapter_openai.utils.tokenizer_pool.TOKENIZER_BATCH_WINDOW",
+        0.01,
+    ), patch.object(batcher, "_run", wraps=batcher._run) as run:
+        results = await asyncio.gather(
+            batcher.count(["a b", "c"]),
+            batcher.count([]),
+            batcher.count(["d e f"]),
+        )
+
+    assert results == [[2, 1], [], [3]]
+    assert run.call_count == 1
+    assert all(name.startswith("tokenizer") for name in encoding.threads)
+
+
+@pytest.mark.asyncio
+async def test_batcher_flushes_full_batch():
+    batcher = TokenizationBatcher(MockEncoding())  # type: ignore
+
+    with patch(
+        "aidial_adapter_openai.utils.tokenizer_pool.TOKENIZER_BATCH_WINDOW",
+        100,
+    ), patch(
+        "aidial_adapter_openai.utils.tokenizer_pool.TOKENIZER_BATCH_MAX_SIZE",
+        2,
+    ):
+        assert await batcher.count(["a", "b c"]) == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_batcher_isolates_errors():
+    batcher = TokenizationBatcher(MockEncoding())  # type: ignore
+
+    with patch(
+        "aidial_adapter_openai.utils.tokenizer_pool.TOKENIZER_BATCH_WINDOW",
+        0.01,
+    ):
+        results = await asyncio.gather(
+            batcher.count(["<|endoftext|>"]),
+            batcher.count(["a b"]),
+            return_exceptions=True,
+        )
+
+    assert isinstance(results[0], ValueError)
+    assert results[1] == [2]
+
+
+@pytest.mark.asyncio
+async def test_batched_prompt_tokens():
+    encoding = MockEncoding("batched-encoding")
+    with patch_encoding(encoding):
+        tokenizer = PlainTextTokenizer("batched-model")
+
+    messages = [
+        {"role": "user", "content": "a b c", "name": "x"},
+        {"role": "assistant", "content": [{"type": "text", "text": "d e"}]},
+    ]
+
+    with patch(
+        "aidial_adapter_openai.utils.tokenizer_pool.TOKENIZER_BATCH_WINDOW",
+        0.01,
+    ):
+        assert await tokenizer.calculate_text_tokens_async("a b") == 2
+        assert await tokenizer.calculate_prompt_tokens_async(
+            messages
+        ) == tokenizer.calculate_prompt_tokens(messages)
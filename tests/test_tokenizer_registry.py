@@ -0,0 +1,49 @@
+from unittest.mock import patch
+
+import pytest
+from aidial_sdk.exceptions import InternalServerError
+
+from aidial_adapter_openai.app import preload_tokenizers
+from aidial_adapter_openai.utils.tokenizer import (
+    MultiModalTokenizer,
+    PlainTextTokenizer,
+    get_tokenizer,
+)
+
+
+@patch("aidial_adapter_openai.utils.tokenizer.encoding_for_model")
+def test_tokenizers_are_shared(encoding_for_model):
+    tokenizer = get_tokenizer(PlainTextTokenizer, "registry-model")
+
+    assert get_tokenizer(PlainTextTokenizer, "registry-model") is tokenizer
+    assert isinstance(
+        get_tokenizer(MultiModalTokenizer, "registry-model"),
+        MultiModalTokenizer,
+    )
+    assert encoding_for_model.call_count == 2
+
+
+@patch("aidial_adapter_openai.utils.tokenizer.encoding_for_model")
+def test_preload_tokenizers(encoding_for_model):
+    with patch(
+        "aidial_adapter_openai.app.MODEL_ALIASES",
+        {"my-gpt-4o": "preload-gpt-4o", "my-gpt-4": "preload-gpt-4"},
+    ), patch("aidial_adapter_openai.app.GPT4O_DEPLOYMENTS", ["my-gpt-4o"]):
+        preload_tokenizers()
+
+    models = {call.args[0] for call in encoding_for_model.call_args_list}
+    assert models == {"preload-gpt-4o", "preload-gpt-4"}
+
+    encoding_for_model.reset_mock()
+    get_tokenizer(MultiModalTokenizer, "preload-gpt-4o")
+    get_tokenizer(PlainTextTokenizer, "preload-gpt-4")
+    assert not encoding_for_model.called
+
+
+def test_preload_fails_on_unknown_model():
+    with patch(
+        "aidial_adapter_openai.app.MODEL_ALIASES",
+        {"my-deployment": "unknown-model"},
+    ):
+        with pytest.raises(InternalServerError):
+            preload_tokenizers()
@@ -0,0 +1,93 @@
+import pytest
+
+from aidial_adapter_openai.utils.tokenizer import PlainTextTokenizer
+from tests.utils.tokenizer import MockEncoding, patch_encoding
+
+
+def create_tokenizer(encoding_name: str) -> PlainTextTokenizer:
+    with patch_encoding(MockEncoding(encoding_name)):
+        return PlainTextTokenizer("tools-model")
+
+
+get_weather = {
+    "name": "get_weather",
+    "description": "Get the weather.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "city": {"type": "string", "description": "The city"},
+            "unit": {
+                "type": "string",
+                "enum": ["c", "f"],
+                "description": "Unit.",
+            },
+        },
+    },
+}
+
+
+@pytest.mark.parametrize(
+    "encoding_name, request_body, expected",
+    [
+        ("cl100k_base", {}, 0),
+        ("cl100k_base", {"tools": []}, 0),
+        (
+            "cl100k_base",
+            {"tools": [{"type": "function", "function": get_weather}]},
+            42,
+        ),
+        (
+            "o200k_base",
+            {"tools": [{"type": "function", "function": get_weather}]},
+            39,
+        ),
+        ("cl100k_base", {"functions": [get_weather]}, 42),
+        (
+            "cl100k_base",
+            {"functions": [{"name": "ping", "parameters": {}}]},
+            10 + 1 + 12,
+        ),
+    ],
+)
+def test_tools_tokens(encoding_name, request_body, expected):
+    tokenizer = create_tokenizer(encoding_name)
+    assert tokenizer.calculate_tools_tokens(request_body) == expected
+
+
+@pytest.mark.parametrize(
+    "message, expected",
+    [
+        (
+            {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "id": "call_1",
+                        "type": "function",
+                        "function": {
+                            "name": "get_weather",
+                            "arguments": '{"city": "Paris"}',
+                        },
+                    }
+                ],
+            },
+            3 + 1 + 1 + 2,
+        ),
+        (
+            {"role": "tool", "tool_call_id": "call_1", "content": "sunny"},
+            3 + 1 + 1 + 1,
+        ),
+        (
+            {
+                "role": "assistant",
+                "content": None,
+                "function_call": {"name": "ping", "arguments": "{}"},
+            },
+            3 + 1 + 1 + 1,
+        ),
+    ],
+)
+def test_tool_call_message_tokens(message, expected):
+    tokenizer = create_tokenizer("cl100k_base")
+    assert tokenizer.calculate_message_tokens(message) == expected
@@ -0,0 +1,137 @@
+from typing import List
+from unittest.mock import patch
+
+import pytest
+
+from aidial_adapter_openai.utils.streaming import generate_stream
+from aidial_adapter_openai.utils.tokenizer import CompletionTokenCounter
+from aidial_adapter_openai.utils.upstream_usage import (
+    request_upstream_usage,
+    supports_stream_options,
+)
+from tests.utils.stream import (
+    chunk,
+    collect,
+    mock_prompt_tokens,
+    single_choice_chunk,
+    to_stream,
+)
+from tests.utils.tokenizer import count_words, create_token_counter
+
+
+@pytest.mark.parametrize(
+    "api_version, is_azure, expected",
+    [
+        ("2024-02-01", True, False),
+        ("2024-08-01-preview", True, False),
+        ("2024-09-01-preview", True, True),
+        ("2024-10-21", True, True),
+        ("invalid", True, False),
+        ("", False, True),
+    ],
+)
+def test_supports_stream_options(api_version, is_azure, expected):
+    assert supports_stream_options(api_version, is_azure) == expected
+
+
+@patch(
+    "aidial_adapter_openai.utils.upstream_usage.UPSTREAM_USAGE_DEPLOYMENTS",
+    ["gpt-4o"],
+)
+@pytest.mark.parametrize(
+    "request_body, deployment, expected",
+    [
+        ({"stream": True}, "gpt-4o", True),
+        ({"stream": True}, "gpt-4", False),
+        ({"stream": False}, "gpt-4o", False),
+        (
+            {"stream": True, "stream_options": {"include_usage": False}},
+            "gpt-4o",
+            False,
+        ),
+    ],
+)
+def test_request_upstream_usage(request_body, deployment, expected):
+    original_stream_options = request_body.get("stream_options")
+
+    assert (
+        request_upstream_usage(request_body, deployment, "2024-10-21", True)
+        == expected
+    )
+
+    if expected:
+        assert request_body["stream_options"] == {"include_usage": True}
+    else:
+        assert request_body.get("stream_options") == original_stream_options
+
+
+async def get_prompt_tokens() -> int:
+    raise AssertionError("The prompt must not be tokenized")
+
+
+def create_failing_token_counter() -> CompletionTokenCounter:
+    return create_token_counter(
+        lambda text: pytest.fail("The completion must not be tokenized")
+    )
+
+
+@pytest.mark.asyncio
+async def test_usage_chunk_is_merged():
+    usage = {"completion_tokens": 1, "prompt_tokens": 2, "total_tokens": 3}
+    chunks = [
+        single_choice_chunk(delta={"role": "assistant", "content": "Hello"}),
+        single_choice_chunk(delta={"content": " there, how"}),
+        single_choice_chunk(delta={"content": " are you doing today?"}),
+        single_choice_chunk(delta={}, finish_reason="stop"),
+        chunk(choices=[], usage=usage),
+    ]
+
+    result = await collect(
+        generate_stream(
+            get_prompt_tokens=get_prompt_tokens,
+            create_token_counter=create_failing_token_counter,
+            deployment="gpt-4o",
+            discarded_messages=None,
+            stream=to_stream(chunks),
+            merge_usage_chunk=True,
+        )
+    )
+
+    assert len(result) == 4
+    assert result[-1]["choices"][0]["finish_reason"] == "stop"
+    assert result[-1]["usage"] == usage
+
+
+@pytest.mark.asyncio
+async def test_missing_usage_chunk_is_counted():
+    chunks = [
+        single_choice_chunk(delta={"role": "assistant", "content": "Hello"}),
+        single_choice_chunk(delta={"content": " there"}),
+        single_choice_chunk(delta={}, finish_reason="stop"),
+    ]
+
+    tokenized: List[str] = []
+
+    def tokenize(text: str) -> int:
+        tokenized.append(text)
+        return count_words(text)
+
+    result = await collect(
+        generate_stream(
+            get_prompt_tokens=mock_prompt_tokens(5),
+            create_token_counter=lambda: create_token_counter(tokenize),
+            deployment="gpt-4o",
+            discarded_messages=None,
+            stream=to_stream(chunks),
+            merge_usage_chunk=True,
+        )
+    )
+
+    assert result[-1]["usage"] == {
+        "completion_tokens": 2,
+        "prompt_tokens": 5,
+        "total_tokens": 7,
+    }
+    # The deltas are tokenized at once after the stream ends
+    assert "".join(tokenized) == "Hello there"
+    assert len(tokenized) <= 2
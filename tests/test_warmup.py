@@ -0,0 +1,102 @@
+import asyncio
+from unittest.mock import patch
+
+import httpx
+import pytest
+import respx
+
+from aidial_adapter_openai.utils.http_client import PoolStats
+from aidial_adapter_openai.utils.warmup import (
+    _prefetch_tasks,
+    get_upstream_base_url,
+    prefetch_connection,
+    warm_up_connections,
+)
+
+
+@pytest.mark.parametrize(
+    "upstream_endpoint, expected_url",
+    [
+        (
+            "https://test.com/openai/deployments/gpt-4/chat/completions",
+            "https://test.com",
+        ),
+        ("https://test.com/v1/chat/completions", "https://test.com/v1"),
+    ],
+)
+def test_upstream_base_url(upstream_endpoint, expected_url):
+    assert get_upstream_base_url(upstream_endpoint) == expected_url
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_warm_up_connections():
+    route = respx.head("https://warmup.com").respond(status_code=404)
+
+    await warm_up_connections(
+        upstream_endpoints=[
+            "https://warmup.com/openai/deployments/gpt-4/chat/completions",
+            "https://warmup.com/invalid",
+        ],
+        dial_url=None,
+        connections=3,
+        timeout=5,
+    )
+
+    assert route.call_count == 3
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_warm_up_failures_are_ignored():
+    route = respx.head("https://warmup-error.com/v1").mock(
+        side_effect=httpx.ConnectError("Connection refused")
+    )
+
+    await warm_up_connections(
+        upstream_endpoints=["https://warmup-error.com/v1/chat/completions"],
+        dial_url=None,
+        connections=1,
+        timeout=5,
+    )
+
+    assert route.called
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_prefetch_connection():
+    route = respx.head("https://prefetch.com").respond(status_code=404)
+
+    endpoint = "https://prefetch.com/openai/deployments/gpt-4o/chat/completions"
+
+    # Concurrent prefetches to the same upstream are deduplicated
+    prefetch_connection(endpoint)
+    prefetch_connection(endpoint)
+
+    await asyncio.gather(*_prefetch_tasks)
+    assert route.call_count == 1
+
+    prefetch_connection(endpoint)
+    await asyncio.gather(*_prefetch_tasks)
+    assert route.call_count == 2
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_prefetch_is_skipped_for_full_pool():
+    route = respx.head("https://full.com").respond(status_code=404)
+
+    stats = PoolStats(
+        max_connections=2, connections=2, idle_connections=0, queued_requests=3
+    )
+    with patch(
+        "aidial_adapter_openai.utils.warmup.get_single_pool_stats",
+        return_value=stats,
+    ):
+        prefetch_connection(
+            "https://full.com/openai/deployments/gpt-4o/chat/completions"
+        )
+
+    await asyncio.gather(*_prefetch_tasks)
+    assert not route.called
@@ -0,0 +1,111 @@
+from typing import AsyncIterator, List
+from unittest.mock import patch
+
+import pytest
+
+from aidial_adapter_openai.utils.streaming import generate_stream
+from tests.utils.stream import chunk, mock_prompt_tokens, single_choice_chunk
+from tests.utils.tokenizer import create_token_counter
+
+USAGE = {"completion_tokens": 1, "prompt_tokens": 2, "total_tokens": 3}
+
+
+@pytest.fixture(autouse=True)
+def zero_lag_deployment():
+    with patch(
+        "aidial_adapter_openai.utils.streaming.ZERO_LAG_STREAMING_DEPLOYMENTS",
+        ["gpt-4"],
+    ):
+        yield
+
+
+async def collect_with_events(
+    chunks: List[dict],
+    events: List[str],
+    discarded_messages=None,
+    merge_usage_chunk=False,
+) -> List[dict]:
+    async def upstream() -> AsyncIterator[dict]:
+        for idx, item in enumerate(chunks):
+            events.append(f"upstream {idx}")
+            yield item
+
+    result = []
+    async for item in generate_stream(
+        get_prompt_tokens=mock_prompt_tokens(10),
+        create_token_counter=create_token_counter,
+        deployment="gpt-4",
+        discarded_messages=discarded_messages,
+        stream=upstream(),
+        merge_usage_chunk=merge_usage_chunk,
+    ):
+        events.append(f"client {len(result)}")
+        result.append(item)
+    return result
+
+
+@pytest.mark.asyncio
+async def test_chunks_are_forwarded_without_holdback():
+    chunks = [
+        single_choice_chunk(delta={"role": "assistant", "content": "Hello"}),
+        single_choice_chunk(delta={"content": " world"}, finish_reason="stop"),
+    ]
+    events: List[str] = []
+
+    result = await collect_with_events(chunks, events, discarded_messages=[0])
+
+    assert events == [
+        "upstream 0",
+        "client 0",
+        "upstream 1",
+        "client 1",
+        "client 2",
+    ]
+    assert result[:2] == chunks
+    assert result[2]["id"] == chunks[-1]["id"]
+    assert result[2]["statistics"] == {"discarded_messages": [0]}
+    assert result[2]["usage"] == {
+        "completion_tokens": 2,
+        "prompt_tokens": 10,
+        "total_tokens": 12,
+    }
+
+
+@pytest.mark.asyncio
+async def test_trailing_chunk_sets_missing_finish_reason():
+    chunks = [single_choice_chunk(delta={"content": "Hello"})]
+
+    result = await collect_with_events(chunks, [])
+
+    assert len(result) == 2
+    assert result[1]["choices"][0]["finish_reason"] == "length"
+
+
+@pytest.mark.asyncio
+async def test_no_trailing_chunk_when_nothing_to_add():
+    chunks = [
+        single_choice_chunk(
+            delta={"content": "Hello"}, finish_reason="stop", usage=USAGE
+        )
+    ]
+
+    assert await collect_with_events(chunks, []) == chunks
+
+
+@pytest.mark.parametrize("eliminate", [False, True])
+@pytest.mark.asyncio
+async def test_usage_chunk_is_sent_as_trailing_chunk(eliminate: bool):
+    chunks = [
+        single_choice_chunk(delta={"content": "Hello"}, finish_reason="stop"),
+        chunk(choices=[], usage=USAGE),
+    ]
+
+    with patch(
+        "aidial_adapter_openai.utils.streaming.ELIMINATE_EMPTY_CHOICES",
+        eliminate,
+    ):
+        result = await collect_with_events(chunks, [], merge_usage_chunk=True)
+
+    assert len(result) == 2
+    assert result[1]["usage"] == USAGE
+    assert result[1]["choices"] == [{"index": 0, "delta": {}}]
@@ -1,8 +1,10 @@
 import json
-from typing import Any, Callable, List
+from typing import Any, AsyncIterator, Awaitable, Callable, List, TypeVar
 
 import httpx
 
+T = TypeVar("T")
+
 
 class OpenAIStream:
     chunks: List[dict]
@@ -89,3 +91,19 @@ def single_choice_chunk(
         usage=usage,
         **kwargs,
     )
+
+
+async def to_stream(items: List[T]) -> AsyncIterator[T]:
+    for item in items:
+        yield item
+
+
+async def collect(stream: AsyncIterator[T]) -> List[T]:
+    return [item async for item in stream]
+
+
+def mock_prompt_tokens(count: int) -> Callable[[], Awaitable[int]]:
+    async def get_prompt_tokens() -> int:
+        return count
+
+    return get_prompt_tokens
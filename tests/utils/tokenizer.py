@@ -0,0 +1,57 @@
+import threading
+from typing import List, Set
+from unittest.mock import patch
+
+import regex
+
+from aidial_adapter_openai.utils.tokenizer import CompletionTokenCounter
+
+WORDS_PATTERN = r"\S+|\s+"
+
+
+class MockEncoding:
+    """
+    Replaces a tiktoken encoding: a token per word or, for the worst case
+    of a byte-level encoding, a token per byte.
+    Records the encoded texts and the threads which encoded them.
+    """
+
+    _pat_str = WORDS_PATTERN
+
+    name: str
+    encoded: List[str]
+    threads: Set[str]
+
+    def __init__(self, name: str = "mock-encoding", per_byte: bool = False):
+        # The token counts are cached by the encoding name,
+        # so the encodings with different behaviour must have different names
+        self.name = name
+        self.per_byte = per_byte
+        self.encoded = []
+        self.threads = set()
+
+    def encode(self, text: str) -> list:
+        self.encoded.append(text)
+        self.threads.add(threading.current_thread().name)
+        if "<|endoftext|>" in text:
+            raise ValueError("Disallowed special token")
+        return list(text.encode()) if self.per_byte else text.split()
+
+
+def bytes_encoding() -> MockEncoding:
+    return MockEncoding("bytes-encoding", per_byte=True)
+
+
+def patch_encoding(encoding: MockEncoding):
+    return patch(
+        "aidial_adapter_openai.utils.tokenizer.encoding_for_model",
+        return_value=encoding,
+    )
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+def create_token_counter(tokenize=count_words) -> CompletionTokenCounter:
+    return CompletionTokenCounter(tokenize, regex.compile(WORDS_PATTERN))